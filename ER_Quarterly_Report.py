@@ -2,7 +2,18 @@
 # Name:        ER Quarterly Report
 # Purpose:     Pulls current data from FIND enterprise geodatabase and
 #              returns Excel spreadsheet containing a summary of data from the
-#              requested report.
+#              requested report. The reporting period is a quarter (e.g.
+#              '2017 Q1', counting every record created before the end of the
+#              quarter) or a start/end date range, and defaults to the last
+#              closed quarter. Reports read the current dm status of every
+#              record in the period. When use_snapshots is True, counts of
+#              closed quarters are kept in a SQLite snapshot store instead, so
+#              a quarterly report only reads the records created since the
+#              last closed quarter, but the dm status of records in a stored
+#              quarter stays frozen as it was when the quarter was stored. A
+#              trend report of per-quarter and cumulative counts over a range
+#              of quarters is built from a single read of the FIND feature
+#              classes.
 # Author:      Molly Moore
 # Created:     2016-09-06
 # Updated:     2016-09-06 - updated to include options for DM Pending and DM
@@ -16,7 +27,8 @@
 #-------------------------------------------------------------------------------
 
 # import system modules
-import arcpy, os, datetime
+import arcpy, os, datetime, time, sqlite3
+from FIND_ReportWriter import writerows
 from arcpy import env
 from arcpy.sa import *
 
@@ -34,104 +46,340 @@ env.workspace = r'in_memory'
 input_features = ["FIND3.DBO.el_pt", "FIND3.DBO.el_line","FIND3.DBO.el_poly", "FIND3.DBO.comm_poly",
 "FIND3.DBO.comm_pt",  "FIND3.DBO.survey_poly"]
 
-# file names that are used for temporary element tables
+# names of the element tables, used as Feature_Class labels
 elementTables = ["element_point", "element_line", "element_poly", "community_poly",
 "community_point", "survey_poly"]
 
 # path to FIND enterprise database
 elementGDB = r"Database Connections\\FIND3.Edit.pgh-gis.sde"
 
+# file format of the reports - '.xlsx', '.csv' or '.parquet'
+report_format = ".xlsx"
+
 reportPath = r'P:\Conservation Programs\Natural Heritage Program\Data Management\Instructions, procedures and documentation\FIND\FIND_2017\Reports\DCNR Quarterly FIND Reports'
 
-def elementType():
-    '''function that assigns element type to all features based on name of
-    shapefile within which the feature is contained'''
+# Feature_Class labels of element records by elem_type - element features
+# without an elem_type keep the name of their table
+elem_type_labels = {0: 'Lepidoptera and Other Insects',
+1: 'Lepidoptera and Other Insects', 2: 'Other Invertebrates', 3: 'Plants',
+4: 'Vertebrate Animals'}
 
-    for ins, output in zip(input_features, elementTables):
-        feature = os.path.join(elementGDB, ins)
+# Feature_Class labels of the community and survey tables
+table_labels = {"community_poly": "Communities", "community_point": "Communities",
+"survey_poly": "Survey Sites"}
+
+# report labels of the dm_stat codes
+status_labels = {"dr": "Draft", "idrev": "Ready for ID Review",
+"dmproc": "DM Processed", "dmready": "Ready for DM", "dmpend": "DM Pending"}
+
+# set to True to build quarterly reports from the snapshot store. stored
+# quarters keep the dm status their records had when they were stored, so
+# later status changes of those records are not reported
+use_snapshots = False
+
+# SQLite database holding the Feature_Class x dm status counts of records
+# created in each closed quarter
+snapshot_database = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+"ER_Quarterly_Report_snapshots.sqlite")
+
+# format of dates in where clauses and accepted formats of date parameters
+date_format = "%Y-%m-%d %H:%M:%S"
+parameter_formats = ["%Y-%m-%d", "%m/%d/%Y", "%Y-%m-%d %H:%M:%S",
+"%m/%d/%Y %I:%M:%S %p"]
+
+def quarterstart(year, quarter):
+    '''function that returns the first day of a quarter'''
+
+    return datetime.datetime(year + (quarter - 1) // 4, (quarter - 1) % 4 * 3 + 1, 1)
+
+def quarterof(date):
+    '''function that returns the year and quarter of a date'''
+
+    return date.year, (date.month - 1) // 3 + 1
+
+def nextquarter(year, quarter):
+    '''function that returns the year and quarter following a quarter'''
+
+    return (year + 1, 1) if quarter == 4 else (year, quarter + 1)
+
+def parsequarter(text):
+    '''function that returns the year and quarter of text such as 2017 Q1,
+    2017Q1 or 2017-Q1'''
 
-        fieldmappings = arcpy.FieldMappings()
-        fieldmappings.addTable(feature)
+    year, quarter = text.upper().replace("-", " ").replace("Q", " ").split()
+    if not 1 <= int(quarter) <= 4:
+        raise ValueError("quarter must be Q1 to Q4: {0}".format(text))
+    return int(year), int(quarter)
 
-        # fields to be kept after spatial join
-        keepFields = ["OID", "dm_stat", "elem_type", "created_on"]
+def parsedate(text):
+    '''function that converts a date parameter into a datetime'''
 
-        # remove all fields not in keep fields from field map
-        for field in fieldmappings.fields:
-            if field.name not in keepFields:
-                fieldmappings.removeFieldMap(fieldmappings.findFieldMapIndex
-                (field.name))
+    for date_format in parameter_formats:
+        try:
+            return datetime.datetime.strptime(text.strip(), date_format)
+        except ValueError:
+            pass
+    raise ValueError("unrecognized date: {0}".format(text))
 
-        arcpy.TableToTable_conversion(os.path.join(elementGDB, ins), env.workspace, output, "", fieldmappings)
+def reportingperiod(quarter="", start="", end=""):
+    '''function that returns the start, end (exclusive), name and (year,
+    quarter) of the reporting period. a quarter reports every record created
+    before the end of the quarter, start and end dates override it, and the
+    default is the last closed quarter. start is None when records are counted
+    from the beginning, and the quarter is None for date range reports'''
 
-    for table in elementTables:
+    if quarter:
+        year, quarter = parsequarter(quarter)
+    else:
+        today = datetime.datetime.today()
+        year, quarter = today.year, (today.month - 1) // 3
+        if quarter == 0:
+            year, quarter = year - 1, 4
+    period_start = None
+    period_end = quarterstart(year, quarter + 1)
+    name = "{0} Q{1}".format(year, quarter)
 
-        arcpy.AddField_management(table, "Feature_Class", "TEXT", field_length = 50, field_alias = "Taxa")
+    if start:
+        period_start = parsedate(start)
+    if end:
+        period_end = parsedate(end)
+    period_quarter = (year, quarter)
+    if start or end:
+        name = "{0} to {1}".format(period_start.strftime("%Y%m%d") if
+        period_start else "start", period_end.strftime("%Y%m%d"))
+        period_quarter = None
+    return period_start, period_end, name, period_quarter
 
-        arcpy.CalculateField_management(table, "Feature_Class", "'" + table + "'", "PYTHON_9.3")
+def periodclause(feature, start, end):
+    '''function that returns the where clause selecting records created in the
+    reporting period. records without a creation date are only counted when
+    the period has no start'''
 
-    for table in elementTables[0:3]:
-        with arcpy.da.UpdateCursor(table, ['elem_type', 'Feature_Class']) as cursor:
+    field = arcpy.AddFieldDelimiters(feature, "created_on")
+    clause = "{0} < '{1}'".format(field, end.strftime(date_format))
+    if start is None:
+        return "({0} OR {1} IS NULL)".format(clause, field)
+    return "{0} >= '{1}' AND {2}".format(field, start.strftime(date_format),
+    clause)
+
+def countrecords(start, end, byquarter=False, undated=False):
+    '''function that reads the element type and dm status of every record
+    created in the reporting period once and counts records by Feature_Class
+    and dm status. returns a dictionary of (Feature_Class, dm status): count,
+    or of ((year, quarter), Feature_Class, dm status): count when byquarter is
+    True. records without a creation date are counted in quarter None. when
+    undated is True only the records without a creation date are read'''
+
+    counts = {}
+    for ins, table in zip(input_features, elementTables):
+        feature = os.path.join(elementGDB, ins)
+
+        # element type is only used for the element point, line and poly tables
+        if table in elementTables[0:3]:
+            fields = ["dm_stat", "created_on", "elem_type"]
+        else:
+            fields = ["dm_stat", "created_on"]
+
+        # records outside of the reporting period are never read
+        if undated:
+            where = "{0} IS NULL".format(arcpy.AddFieldDelimiters(feature,
+            "created_on"))
+        else:
+            where = periodclause(feature, start, end)
+        with arcpy.da.SearchCursor(feature, fields, where) as cursor:
             for row in cursor:
-                if row[0] == 0 or row[0] == 1:
-                    row[1] = 'Lepidoptera and Other Insects'
-                    cursor.updateRow(row)
-                elif row [0] == 2:
-                    row[1] = 'Other Invertebrates'
-                    cursor.updateRow(row)
-                elif row[0] == 3:
-                    row[1] = 'Plants'
-                    cursor.updateRow(row)
-                elif row[0] == 4:
-                    row[1] = 'Vertebrate Animals'
-                    cursor.updateRow(row)
-
-        arcpy.DeleteField_management(table, "elem_type")
-
-    elementRecords = arcpy.CreateTable_management(env.workspace, "elementRecords", "element_point")
-    arcpy.Append_management(elementTables, elementRecords)
-
-    with arcpy.da.UpdateCursor(elementRecords, ["dm_stat", "Feature_Class"]) as cursor:
-        for row in cursor:
-            if row[0] == "dr":
-                row[0] = "Draft"
-                cursor.updateRow(row)
-            if row[0] == "idrev":
-                row[0] = "Ready for ID Review"
-                cursor.updateRow(row)
-            if row[0] == "dmproc":
-                row[0] = "DM Processed"
-                cursor.updateRow(row)
-            if row[0] == "dmready":
-                row[0] = "Ready for DM"
-                cursor.updateRow(row)
-            if row[0] == "dmpend":
-                row[0] = "DM Pending"
-                cursor.updateRow(row)
-            if row[1] == "community_poly" or row[1] == "community_point":
-                row[1] = "Communities"
-                cursor.updateRow(row)
-            if row [1] == "survey_poly":
-                row[1] = "Survey Sites"
-                cursor.updateRow(row)
-
-    with arcpy.da.UpdateCursor(elementRecords, "created_on") as cursor:
-        for row in cursor:
-            if row[0] >= datetime.datetime(2017, 04, 01, 0, 0, 0, 0):
-                cursor.deleteRow()
-
-    summaryTable = arcpy.Statistics_analysis(elementRecords, "summaryTable", "Feature_Class COUNT;dm_stat COUNT",
-    "Feature_Class;dm_stat")
-
-    pivotTable = arcpy.PivotTable_management(summaryTable, 'Feature_Class', 'dm_stat', 'FREQUENCY', "pivotTable")
-
-    arcpy.AddField_management(pivotTable, "Total", "LONG", "", "", 8, "Total")
-    arcpy.CalculateField_management(pivotTable, "Total", "!DM_Pending! + !DM_Processed! + !Ready_for_DM! + !Draft! + !Ready_for_ID_Review!", "PYTHON_9.3")
-
-    # export table as Excel file to produce final report
-    filename = "FIND Quarterly Report " + time.strftime("%d%b%y")+".xls"
+                if len(row) > 2:
+                    label = elem_type_labels.get(row[2], table)
+                else:
+                    label = table_labels.get(table, table)
+                key = (label, status_labels.get(row[0], row[0]))
+                if byquarter:
+                    key = (quarterof(row[1]) if row[1] else None,) + key
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+def opensnapshots():
+    '''function that opens the snapshot store, creating its tables the first
+    time'''
+
+    connection = sqlite3.connect(snapshot_database)
+    connection.execute("CREATE TABLE IF NOT EXISTS closed_quarters "
+    "(year INTEGER, quarter INTEGER, closed_on TEXT)")
+    connection.execute("CREATE TABLE IF NOT EXISTS quarter_counts "
+    "(year INTEGER, quarter INTEGER, feature_class TEXT, dm_stat TEXT, "
+    "count INTEGER)")
+    return connection
+
+def lastsnapshot(connection):
+    '''function that returns the year and quarter of the last closed quarter in
+    the snapshot store, or None when it is empty'''
+
+    return connection.execute("SELECT year, quarter FROM closed_quarters "
+    "ORDER BY year DESC, quarter DESC LIMIT 1").fetchone()
+
+def readsnapshots(connection, year, quarter):
+    '''function that returns the stored counts of every record created up to
+    the end of a quarter as a dictionary of (Feature_Class, dm status): count'''
+
+    counts = {}
+    for label, status, count in connection.execute("SELECT feature_class, "
+    "dm_stat, SUM(count) FROM quarter_counts WHERE year * 4 + quarter <= ? "
+    "GROUP BY feature_class, dm_stat", (year * 4 + quarter,)):
+        counts[(label, status)] = count
+    return counts
+
+def quarterlycounts(year, quarter):
+    '''function that returns the counts of every record created up to the end
+    of a quarter. stored counts are used for closed quarters, and only records
+    created since the last closed quarter are read. quarters that have closed
+    since then are added to the snapshot store, so that the report of a closed
+    quarter can be reproduced exactly later. the counts of a stored quarter
+    keep the dm status its records had when it was stored, and are not
+    updated when a record changes status later. records without a creation date
+    can be added at any time, so they are never stored and are read again for
+    every report, the same as a scan of every record would count them'''
+
+    connection = opensnapshots()
+    try:
+        last = lastsnapshot(connection)
+        if last is not None and tuple(last) >= (year, quarter):
+            return addcounts(readsnapshots(connection, year, quarter),
+            countrecords(None, None, undated=True))
+
+        # read the records created after the last closed quarter, or every
+        # record the first time
+        start = quarterstart(*nextquarter(*last)) if last else None
+        increments = countrecords(start, quarterstart(year, quarter + 1), True)
+
+        # records without a creation date are only read with the rest the
+        # first time
+        if start is None:
+            undated = {}
+            for (q, label, status), count in increments.items():
+                if q is None:
+                    del increments[(q, label, status)]
+                    undated[(label, status)] = count
+        else:
+            undated = countrecords(None, None, undated=True)
+
+        first = nextquarter(*last) if last else min([q for q, label, status in
+        increments] or [(year, quarter)])
+
+        # store every quarter up to the reporting quarter that has closed
+        current = quarterof(datetime.datetime.today())
+        closing = first
+        while closing <= (year, quarter) and closing < current:
+            connection.execute("INSERT INTO closed_quarters VALUES (?, ?, ?)",
+            closing + (datetime.datetime.today().strftime(date_format),))
+            connection.executemany("INSERT INTO quarter_counts VALUES "
+            "(?, ?, ?, ?, ?)", [q + (label, status, count) for (q, label,
+            status), count in increments.items() if q == closing])
+            closing = nextquarter(*closing)
+        connection.commit()
+
+        # stored counts up to the reporting quarter plus the records created in
+        # quarters that are still open
+        counts = readsnapshots(connection, year, quarter)
+        for (q, label, status), count in increments.items():
+            if q >= closing:
+                counts[(label, status)] = counts.get((label, status), 0) + count
+        return addcounts(counts, undated)
+    finally:
+        connection.close()
+
+def addcounts(counts, more):
+    '''function that adds the (Feature_Class, dm status): count dictionary more
+    to counts and returns counts'''
+
+    for key, count in more.items():
+        counts[key] = counts.get(key, 0) + count
+    return counts
+
+def pivotcounts(counts):
+    '''function that turns the counts into pivot table rows of Feature_Class,
+    one count for each dm status and the total. returns the dm statuses and the
+    rows sorted by Feature_Class'''
+
+    statuses = sorted(set(status for label, status in counts), key=lambda
+    status: (status is None, status))
+    labels = sorted(set(label for label, status in counts))
+    rows = []
+    for label in labels:
+        values = [counts.get((label, status), 0) for status in statuses]
+        rows.append([label] + values + [sum(values)])
+    return statuses, rows
+
+def elementType(start, end, name, quarter=None):
+    '''function that counts records by Feature_Class and dm status in a single
+    pass over the FIND feature classes and writes the pivot table rows straight
+    to the report file. quarterly reports use the snapshot store when
+    use_snapshots is True'''
+
+    if quarter is not None and use_snapshots:
+        counts = quarterlycounts(*quarter)
+    else:
+        counts = countrecords(start, end)
+    statuses, rows = pivotcounts(counts)
+
+    # pivot table field names are the dm status labels with underscores
+    fields = [str(status).replace(" ", "_") for status in statuses]
+
+    # export pivot table rows as Excel file to produce final report
+    filename = "FIND Quarterly Report " + name + " " + time.strftime("%d%b%y") + report_format
     outTable = os.path.join(reportPath, filename)
-    arcpy.TableToExcel_conversion(pivotTable, outTable)
+    writerows(outTable, ["Feature_Class"] + fields + ["Total"], rows)
     print "DCNR FIND Quarterly Report Created!"
 
-elementType()
\ No newline at end of file
+def trendrows(increments, first, last):
+    '''function that turns counts by quarter into trend rows of Feature_Class,
+    dm status, quarter, records created in the quarter and cumulative records
+    for every quarter from first to last. the cumulative count includes records
+    created before the first quarter and records without a creation date'''
+
+    rows = []
+    for label, status in sorted(set((label, status) for q, label, status in
+    increments), key=lambda key: (key[0], key[1] is None, key[1])):
+        cumulative = sum(count for (q, l, s), count in increments.items() if
+        (l, s) == (label, status) and (q is None or q < first))
+        quarter = first
+        while quarter <= last:
+            count = increments.get((quarter, label, status), 0)
+            cumulative += count
+            rows.append([label, status, "{0} Q{1}".format(*quarter), count,
+            cumulative])
+            quarter = nextquarter(*quarter)
+    return rows
+
+def trendreport(first, last):
+    '''function that counts records by Feature_Class, dm status and quarter in a
+    single pass over the FIND feature classes and writes a trend table of
+    per-quarter and cumulative counts to the report file'''
+
+    increments = countrecords(None, quarterstart(last[0], last[1] + 1), True)
+
+    # export trend rows as Excel file to produce final report
+    filename = "FIND Quarterly Trend Report {0} Q{1} to {2} Q{3} ".format(
+    *(first + last)) + time.strftime("%d%b%y") + report_format
+    outTable = os.path.join(reportPath, filename)
+    writerows(outTable, ["Feature_Class", "dm_stat", "Quarter",
+    "Quarter_Records", "Cumulative_Records"], trendrows(increments, first, last))
+    print "DCNR FIND Quarterly Trend Report Created!"
+
+################################################################################
+# Start Script...
+################################################################################
+
+# reporting quarter (e.g. '2017 Q1') and optional start and end dates
+start, end, name, quarter = reportingperiod(arcpy.GetParameterAsText(0),
+arcpy.GetParameterAsText(1), arcpy.GetParameterAsText(2))
+
+# first quarter of a trend report (e.g. '2016 Q1') - the trend runs to the
+# reporting quarter
+trend_start = arcpy.GetParameterAsText(3)
+
+if trend_start:
+    if quarter is None:
+        raise ValueError("trend reports need a reporting quarter, not a date range")
+    trendreport(parsequarter(trend_start), quarter)
+else:
+    elementType(start, end, name, quarter)
@@ -4,7 +4,16 @@
 #              polys and return a single point feature class that includes source
 #              points, and centroids of source lines and polygons. This script
 #              should be run monthly after the Biotics update so that the output
-#              can be added to the FIND feature services.
+#              can be added to the FIND feature services. Centroids are
+#              computed with NumPy while the source features are streamed, and
+#              written to the output in a single pass. After the first run
+#              the output is refreshed in place: only source features that
+#              were added or changed since the last run are recomputed and
+#              features removed from Biotics are dropped. Full rebuilds can
+#              split each source class into OBJECTID range chunks and compute
+#              them in a pool of worker processes. The centroids are also
+#              exported as memory-mappable .npy columns (and an Arrow IPC file
+#              when pyarrow is installed) next to the output geodatabase.
 # Author:      Molly Moore
 # Created:     2017-02-20
 # Updated:
@@ -14,7 +23,12 @@
 #-------------------------------------------------------------------------------
 
 # import system modules
-import arcpy, os, datetime
+import arcpy, os, sys, datetime, time, json, hashlib, multiprocessing
+import numpy, shutil
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 # set tools to overwrite existing outputs
 arcpy.env.overwriteOutput = True
@@ -25,17 +39,490 @@ arcpy.env.workspace = r'in_memory'
 biotics_database = r'W:\Heritage\Heritage_Data\Biotics_datasets.gdb' # biotics dataset
 output_database = r'W:\To_Server\BioticsToFIND.gdb'
 input_features = ['eo_sourceln', 'eo_sourcept', 'eo_sourcepy'] # feature class names of source lines, points, and polys
-out_features = ['line', 'point', 'polygon'] # temporary centroid feature classes to be merged
-output_feature = 'Biotics_SourceFeature_centroids_' + time.strftime("%Y%m%d") # filename of output centroid feature class
-
-merge_features = [] # empty list that will hold paths of temporary centroid feature classes to be merged
-# enter into zipped loop including biotics source features as input
-for in_feature, out_feature in zip(input_features, out_features):
-    biotics_feature = os.path.join(biotics_database, in_feature)
-    # create centroids for all biotics source features
-    output = arcpy.FeatureToPoint_management(biotics_feature, out_feature, "CENTROID")
-    # add path of temporary centroid feature classes to merge_features list
-    merge_features.append(output)
-
-# merge centroid feature classes into one Biotics source feature centroid feature class
-arcpy.Merge_management(merge_features, os.path.join(output_database, output_feature))
\ No newline at end of file
+output_feature = 'Biotics_SourceFeature_centroids' # filename of output centroid feature class, refreshed in place each month
+source_id_field = 'SF_ID' # source feature ID that links output points to biotics source features
+hash_field = 'SF_HASH' # output field holding the hash of the source geometry and attributes
+full_refresh = False # set to True to rebuild the output from scratch instead of refreshing changed features
+
+batch_size = 10000 # number of source features held in memory while centroids are computed, also the size of each parallel chunk
+columnar_output = os.path.join(os.path.dirname(output_database), output_feature) # folder of .npy columns written next to the output geodatabase, None to skip the export
+centroid_workers = multiprocessing.cpu_count() # number of worker processes computing chunks of a full rebuild, 1 computes them in this process
+
+# field types returned by ListFields and the matching AddField types
+field_types = {'String': 'TEXT', 'Integer': 'LONG', 'SmallInteger': 'SHORT',
+'Double': 'DOUBLE', 'Single': 'FLOAT', 'Date': 'DATE', 'GUID': 'GUID',
+'GlobalID': 'GUID'}
+
+################################################################################
+# Define centroid functions
+################################################################################
+
+def segmentarrays(parts, fid):
+    '''function that turns the rings or paths of a feature into arrays of
+    segment start and end coordinates, tagged with the index of the feature'''
+
+    x0 = []
+    y0 = []
+    x1 = []
+    y1 = []
+    for part in parts:
+        xy = numpy.asarray(part, dtype=float)[:, :2]
+        if len(xy) < 2:
+            continue
+        x0.append(xy[:-1, 0])
+        y0.append(xy[:-1, 1])
+        x1.append(xy[1:, 0])
+        y1.append(xy[1:, 1])
+    if not x0:
+        return None
+    x0 = numpy.concatenate(x0)
+    return (x0, numpy.concatenate(y0), numpy.concatenate(x1),
+    numpy.concatenate(y1), numpy.repeat(fid, len(x0)))
+
+def pointcentroids(points, count):
+    '''function that returns the mean of the vertices of each feature. points is
+    a list of (vertex array, feature index) pairs'''
+
+    xy = numpy.concatenate([vertices for vertices, fid in points])
+    fids = numpy.concatenate([numpy.repeat(fid, len(vertices)) for vertices,
+    fid in points])
+    n = numpy.bincount(fids, minlength=count).astype(float)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (numpy.bincount(fids, xy[:, 0], count) / n,
+        numpy.bincount(fids, xy[:, 1], count) / n)
+
+def linecentroids(segments, count):
+    '''function that returns the length weighted centroid of the paths of each
+    feature, computed for all features at once'''
+
+    x0, y0, x1, y1, fids = [numpy.concatenate(s) for s in zip(*segments)]
+    length = numpy.hypot(x1 - x0, y1 - y0)
+    total = numpy.bincount(fids, length, count)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (numpy.bincount(fids, length * (x0 + x1) / 2, count) / total,
+        numpy.bincount(fids, length * (y0 + y1) / 2, count) / total)
+
+def polygoncentroids(segments, count):
+    '''function that returns the area weighted centroid of the rings of each
+    feature using the shoelace formula, computed for all features at once.
+    holes run in the opposite direction to outer rings, so their signed area is
+    subtracted automatically'''
+
+    x0, y0, x1, y1, fids = [numpy.concatenate(s) for s in zip(*segments)]
+    # shift each feature to its first vertex to keep the products small
+    first = numpy.unique(fids, return_index=True)
+    ox = numpy.zeros(count)
+    oy = numpy.zeros(count)
+    ox[first[0]] = x0[first[1]]
+    oy[first[0]] = y0[first[1]]
+    x0 = x0 - ox[fids]
+    x1 = x1 - ox[fids]
+    y0 = y0 - oy[fids]
+    y1 = y1 - oy[fids]
+
+    cross = x0 * y1 - x1 * y0
+    area = numpy.bincount(fids, cross, count) / 2
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (numpy.bincount(fids, (x0 + x1) * cross, count) / (6 * area) + ox,
+        numpy.bincount(fids, (y0 + y1) * cross, count) / (6 * area) + oy)
+
+def shapecentroids(shapes):
+    '''function that returns the centroid x and y arrays of a list of Esri JSON
+    geometries. points keep their location, multipoints use the mean of their
+    points, lines are length weighted and polygons are area weighted. features
+    with no length or area fall back to the mean of their vertices'''
+
+    count = len(shapes)
+    x = numpy.full(count, numpy.nan)
+    y = numpy.full(count, numpy.nan)
+    points = []
+    lines = []
+    polygons = []
+    for fid, shape in enumerate(shapes):
+        if shape is None:
+            continue
+        if 'x' in shape:
+            if shape['x'] is not None:
+                x[fid] = shape['x']
+                y[fid] = shape['y']
+            continue
+        parts = shape.get('rings') or shape.get('paths') or [shape.get('points')]
+        parts = [part for part in parts if part]
+        if not parts:
+            continue
+        points.append((numpy.concatenate([numpy.asarray(part, dtype=float)[:, :2]
+        for part in parts]), fid))
+        segments = segmentarrays(parts, fid)
+        if segments is None:
+            continue
+        if 'rings' in shape:
+            polygons.append(segments)
+        elif 'paths' in shape:
+            lines.append(segments)
+
+    # compute the fallback first so it is replaced wherever a weighted centroid
+    # exists
+    for centroids, features in ((pointcentroids, points),
+    (linecentroids, lines), (polygoncentroids, polygons)):
+        if not features:
+            continue
+        cx, cy = centroids(features, count)
+        valid = numpy.isfinite(cx) & numpy.isfinite(cy)
+        x[valid] = cx[valid]
+        y[valid] = cy[valid]
+    return x, y
+
+def readshape(geometry):
+    '''function that returns the Esri JSON of a geometry, densifying true curves
+    so that they are represented by vertices'''
+
+    if geometry is None:
+        return None
+    shape = json.loads(geometry.JSON)
+    if 'curveRings' in shape or 'curvePaths' in shape:
+        shape = json.loads(geometry.densify('ANGLE', 0, 0.0174533).JSON)
+    return shape
+
+################################################################################
+# Define output functions
+################################################################################
+
+def outputfields(features):
+    '''function that returns the attribute fields of the source feature classes
+    as (name, type, length) in the order they are first found, the same fields
+    kept by the merge of the source feature classes'''
+
+    fields = []
+    names = set()
+    for feature in features:
+        describe = arcpy.Describe(feature)
+        skip = set([describe.OIDFieldName, describe.shapeFieldName,
+        getattr(describe, 'lengthFieldName', ''), getattr(describe,
+        'areaFieldName', '')])
+        for field in arcpy.ListFields(feature):
+            if field.name in skip or field.type not in field_types:
+                continue
+            if field.name.lower() in names:
+                continue
+            names.add(field.name.lower())
+            fields.append((field.name, field_types[field.type], field.length))
+    return fields
+
+def createoutput(path, features, fields):
+    '''function that creates the empty output point feature class with the
+    source feature class fields and ORIG_FID'''
+
+    spatial_reference = arcpy.Describe(features[0]).spatialReference
+    arcpy.CreateFeatureclass_management(os.path.dirname(path),
+    os.path.basename(path), "POINT", spatial_reference=spatial_reference)
+    arcpy.AddField_management(path, "ORIG_FID", "LONG")
+    arcpy.AddField_management(path, hash_field, "TEXT", field_length=32)
+    for name, field_type, length in fields:
+        if field_type == 'TEXT':
+            arcpy.AddField_management(path, name, field_type,
+            field_length=length)
+        else:
+            arcpy.AddField_management(path, name, field_type)
+
+def sourcerows(feature, fields, where=None):
+    '''function that streams the source features in batches of batch_size rows.
+    each batch is a list of (geometry, OBJECTID, attribute values, hash of the
+    geometry and attributes) with a null value for output fields the feature
+    class doesn't have. geometries are only hashed here, and are parsed when
+    their centroids are computed'''
+
+    present = set(field.name.lower() for field in arcpy.ListFields(feature))
+    read = [name for name, field_type, length in fields if name.lower() in
+    present]
+    index = dict((name, i) for i, name in enumerate(read))
+
+    batch = []
+    with arcpy.da.SearchCursor(feature, ['SHAPE@', 'OID@'] + read, where) as cursor:
+        for row in cursor:
+            values = [row[index[name] + 2] if name in index else None for name,
+            field_type, length in fields]
+            shape = row[0].JSON if row[0] is not None else ''
+            digest = hashlib.md5((shape + repr(values)).encode('utf-8'))
+            batch.append((row[0], row[1], values, digest.hexdigest()))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def oidchunks(feature, fields):
+    '''function that splits a source feature class into OBJECTID ranges of
+    batch_size rows. returns (feature, fields, where clause) for each chunk'''
+
+    with arcpy.da.SearchCursor(feature, ['OID@']) as cursor:
+        oids = sorted(row[0] for row in cursor)
+    oidfield = arcpy.AddFieldDelimiters(feature,
+    arcpy.Describe(feature).OIDFieldName)
+
+    chunks = []
+    for i in range(0, len(oids), batch_size):
+        where = "{0} >= {1} AND {0} <= {2}".format(oidfield, oids[i],
+        oids[min(i + batch_size, len(oids)) - 1])
+        chunks.append((feature, fields, where))
+    return chunks
+
+def centroidchunk(chunk):
+    '''function that computes the output rows of one OBJECTID range chunk in a
+    worker process'''
+
+    feature, fields, where = chunk
+    rows = []
+    for batch in sourcerows(feature, fields, where):
+        rows.extend(centroidrows(batch))
+    return rows
+
+def writecentroids(features, output):
+    '''function that computes the centroids of every source feature and writes
+    them to a single merged output feature class in one pass. with more than
+    one worker, the source feature classes are computed in OBJECTID range
+    chunks by a process pool and the chunks are written in order'''
+
+    fields = outputfields(features)
+    createoutput(output, features, fields)
+
+    with arcpy.da.InsertCursor(output, ['SHAPE@XY', 'ORIG_FID', hash_field] +
+    [name for name, field_type, length in fields]) as cursor:
+        if centroid_workers <= 1:
+            for feature in features:
+                for batch in sourcerows(feature, fields):
+                    for row in centroidrows(batch):
+                        cursor.insertRow(row)
+            return
+
+        chunks = []
+        for feature in features:
+            chunks.extend(oidchunks(feature, fields))
+
+        # ArcGIS runs scripts inside its own executable, so workers have to be
+        # started with the python interpreter
+        if not os.path.basename(sys.executable).lower().startswith('python'):
+            multiprocessing.set_executable(os.path.join(sys.exec_prefix,
+            'pythonw.exe'))
+        pool = multiprocessing.Pool(centroid_workers)
+        try:
+            # hand out a few chunks per worker at a time so that no more than
+            # that many computed chunks are held in memory
+            window = centroid_workers * 2
+            for i in range(0, len(chunks), window):
+                for rows in pool.imap(centroidchunk, chunks[i:i + window]):
+                    for row in rows:
+                        cursor.insertRow(row)
+        finally:
+            pool.close()
+            pool.join()
+
+def centroidrows(batch):
+    '''function that computes the centroids of a batch of source rows and
+    returns them as output rows of SHAPE@XY, ORIG_FID, hash and attributes.
+    features with empty geometry are kept without a point'''
+
+    x, y = shapecentroids([readshape(geometry) for geometry, oid, values,
+    digest in batch])
+    rows = []
+    for cx, cy, (geometry, oid, values, digest) in zip(x, y, batch):
+        point = None if numpy.isnan(cx) else (cx, cy)
+        rows.append([point, oid, digest] + values)
+    return rows
+
+def sqlvalues(values):
+    '''function that formats values for a where clause IN list'''
+
+    return ", ".join(str(value) if isinstance(value, (int, long, float)) else
+    "'{0}'".format(unicode(value).replace("'", "''")) for value in values)
+
+def schemakey(fields):
+    '''function that returns the (name, type, length) output fields in a form
+    that can be compared. only text fields are compared by length'''
+
+    return [(name.lower(), field_type, length if field_type == 'TEXT' else None)
+    for name, field_type, length in fields]
+
+def refreshcentroids(features, output):
+    '''function that refreshes an existing output in place. source features
+    are matched to output points by source feature ID, and only features that
+    were added or whose geometry/attribute hash changed are recomputed.
+    output points whose source feature was deleted are removed. features
+    without a source feature ID can't be matched and are always rebuilt. when
+    the fields of the source feature classes no longer match the output the
+    output is rebuilt, since every hash changes with the fields anyway'''
+
+    fields = outputfields(features)
+    existing_fields = [field for field in outputfields([output]) if
+    field[0].lower() not in ('orig_fid', hash_field.lower())]
+    if schemakey(fields) != schemakey(existing_fields):
+        print "Source fields changed, rebuilding the output"
+        writecentroids(features, output)
+        return
+
+    names = [name for name, field_type, length in fields]
+    key = names.index(source_id_field)
+
+    # hash of every source feature in the current output
+    existing = {}
+    with arcpy.da.SearchCursor(output, [source_id_field, hash_field]) as cursor:
+        for row in cursor:
+            if row[0] is not None:
+                existing[row[0]] = row[1]
+
+    # compute centroids only for added and changed source features
+    added = []
+    changed = {}
+    unkeyed = []
+    seen = set()
+    for feature in features:
+        for batch in sourcerows(feature, fields):
+            stale = []
+            for row in batch:
+                sf_id = row[2][key]
+                if sf_id is not None:
+                    seen.add(sf_id)
+                    if existing.get(sf_id, None) == row[3]:
+                        continue
+                stale.append(row)
+            for row in centroidrows(stale):
+                sf_id = row[3 + key]
+                if sf_id is None:
+                    unkeyed.append(row)
+                elif sf_id in existing:
+                    changed[sf_id] = row
+                else:
+                    added.append(row)
+    removed = set(existing) - seen
+
+    output_fields = ['SHAPE@XY', 'ORIG_FID', hash_field] + names
+    edit = arcpy.da.Editor(os.path.dirname(output))
+    edit.startEditing(False, False)
+    edit.startOperation()
+
+    # update changed points and delete removed points, selecting them by
+    # source feature ID in groups
+    ids = sorted(set(changed) | removed)
+    for i in range(0, len(ids), 1000):
+        where = "{0} IN ({1})".format(arcpy.AddFieldDelimiters(output,
+        source_id_field), sqlvalues(ids[i:i + 1000]))
+        with arcpy.da.UpdateCursor(output, output_fields, where) as cursor:
+            for row in cursor:
+                if row[3 + key] in removed:
+                    cursor.deleteRow()
+                else:
+                    cursor.updateRow(changed[row[3 + key]])
+
+    # points without a source feature ID are replaced every time
+    where = "{0} IS NULL".format(arcpy.AddFieldDelimiters(output,
+    source_id_field))
+    with arcpy.da.UpdateCursor(output, [source_id_field], where) as cursor:
+        for row in cursor:
+            cursor.deleteRow()
+
+    with arcpy.da.InsertCursor(output, output_fields) as cursor:
+        for row in added + unkeyed:
+            cursor.insertRow(row)
+
+    edit.stopOperation()
+    edit.stopEditing(True)
+
+    print "{0} added, {1} changed, {2} removed".format(len(added),
+    len(changed), len(removed))
+
+################################################################################
+# Define columnar export functions
+################################################################################
+
+def columnarray(values, field_type, length):
+    '''function that converts a column of field values into a numpy array and a
+    mask of null values. text is stored as fixed width unicode as wide as the
+    longest value (not the declared field length, which can be thousands of
+    characters), integers as int64, doubles as float64 and dates as
+    datetime64[us]'''
+
+    nulls = numpy.array([value is None for value in values], dtype=bool)
+    if field_type in ('TEXT', 'GUID'):
+        width = max([len(value) for value in values if value] or [1])
+        array = numpy.array([u'' if value is None else value for value in
+        values], dtype='U{0}'.format(width))
+    elif field_type in ('LONG', 'SHORT'):
+        array = numpy.array([0 if value is None else value for value in values],
+        dtype='int64')
+    elif field_type in ('DOUBLE', 'FLOAT'):
+        array = numpy.array([numpy.nan if value is None else value for value in
+        values], dtype='float64')
+    else:
+        array = numpy.array(values, dtype='datetime64[us]')
+    return array, nulls
+
+def exportcolumns(output, folder):
+    '''function that exports the output centroids as one .npy file per column
+    with a schema.json describing them, so that consumers can open the columns
+    with numpy.load(path, mmap_mode='r') without reading the geodatabase.
+    columns with nulls get a <column>.null.npy mask. when pyarrow is installed
+    the same table is written as an Arrow IPC file, centroids.arrow. the export
+    is written to a staging folder and swapped in when complete'''
+
+    fields = [(field.name, field_types[field.type], field.length) for field in
+    arcpy.ListFields(output) if field.type in field_types]
+
+    with arcpy.da.SearchCursor(output, ['SHAPE@X', 'SHAPE@Y'] + [name for
+    name, field_type, length in fields]) as cursor:
+        columns = zip(*cursor) or [[] for i in range(len(fields) + 2)]
+
+    staging = folder + "_staging"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+
+    schema = []
+    arrays = []
+    for (name, field_type, length), values in zip([('x', 'DOUBLE', 8),
+    ('y', 'DOUBLE', 8)] + fields, columns):
+        array, nulls = columnarray(values, field_type, length)
+        numpy.save(os.path.join(staging, name + ".npy"), array)
+        column = {'name': name, 'dtype': array.dtype.str, 'file': name + ".npy"}
+        if field_type == 'TEXT':
+            column['length'] = length
+        if nulls.any():
+            numpy.save(os.path.join(staging, name + ".null.npy"), nulls)
+            column['nulls'] = name + ".null.npy"
+        schema.append(column)
+        arrays.append((name, array, nulls))
+
+    with open(os.path.join(staging, "schema.json"), 'w') as f:
+        json.dump({'rows': len(columns[0]), 'columns': schema}, f, indent=4)
+
+    if pyarrow is not None:
+        table = pyarrow.Table.from_arrays([pyarrow.array(array, mask=nulls) for
+        name, array, nulls in arrays], names=[name for name, array, nulls in
+        arrays])
+        sink = pyarrow.OSFile(os.path.join(staging, "centroids.arrow"), 'wb')
+        writer = pyarrow.RecordBatchFileWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+        sink.close()
+
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.rename(staging, folder)
+
+################################################################################
+# Start Script...
+################################################################################
+
+if __name__ == '__main__':
+    source_features = [os.path.join(biotics_database, in_feature) for in_feature in
+    input_features]
+    output = os.path.join(output_database, output_feature)
+
+    if full_refresh or not arcpy.Exists(output):
+        # compute centroids for all biotics source features and write them into one
+        # Biotics source feature centroid feature class
+        writecentroids(source_features, output)
+    else:
+        # only recompute centroids for source features that changed since last month
+        refreshcentroids(source_features, output)
+
+    if columnar_output:
+        exportcolumns(output, columnar_output)
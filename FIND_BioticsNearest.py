@@ -0,0 +1,205 @@
+#-------------------------------------------------------------------------------
+# Name:        FIND Biotics Nearest
+# Purpose:     Builds a spatial index over the Biotics source feature centroids
+#              exported by FIND_BioticsCentroids.py and returns the nearest
+#              Biotics source features for FIND records. The index can be
+#              imported and queried for single features, and running this
+#              script annotates every FIND element point, line and polygon
+#              with its nearest Biotics source features in a table.
+# Author:      agent
+# Created:     2026-10-18
+# Updated:
+#
+# To Do List/Future ideas:
+#
+#-------------------------------------------------------------------------------
+
+# import system modules
+import arcpy, os
+import numpy
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# set tools to overwrite existing outputs
+arcpy.env.overwriteOutput = True
+
+# set input parameters
+output_database = r'W:\To_Server\BioticsToFIND.gdb'
+biotics_centroids = os.path.join(output_database, 'Biotics_SourceFeature_centroids') # centroid feature class, used for its spatial reference
+centroid_folder = os.path.join(os.path.dirname(output_database), 'Biotics_SourceFeature_centroids') # columnar export of the centroids
+source_id_field = 'SF_ID' # source feature ID of the biotics centroids
+biotics_element_field = 'ELSUBID' # element subnational ID of the biotics centroids
+find_element_field = 'elem_name' # element subnational ID of the FIND features
+
+workspace = r"C:\Users\mmoore\AppData\Roaming\ESRI\Desktop10.4\ArcCatalog\FIND3.Edit.pgh-gis.sde"
+el_pt = r'{}\FIND3.DBO.el_pt'.format(workspace)
+el_line = r'{}\FIND3.DBO.el_line'.format(workspace)
+el_poly = r'{}\FIND3.DBO.el_poly'.format(workspace)
+input_features = [el_pt, el_line, el_poly]
+
+nearest_count = 5 # number of nearest biotics source features returned for each FIND feature
+search_distance = 1000 # only return biotics source features within this distance, in units of the biotics spatial reference
+same_element = False # set to True to only return biotics source features of the same element
+output_table = os.path.join(output_database, 'FIND_Biotics_nearest') # table written by the batch annotation
+
+################################################################################
+# Define spatial index
+################################################################################
+
+class CentroidIndex(object):
+    '''spatial index over the biotics source feature centroids that returns the
+    nearest source features to a location. uses a scipy KD-tree when scipy is
+    installed, otherwise a grid of cell_size cells. id_nulls and element_nulls
+    are masks of the centroids whose source feature ID or element is null'''
+
+    def __init__(self, x, y, ids, elements=None, cell_size=search_distance,
+    id_nulls=None, element_nulls=None):
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        # centroids of features without geometry can't be found, and centroids
+        # without a source feature ID can't be reported
+        valid = numpy.isfinite(x) & numpy.isfinite(y)
+        if id_nulls is not None:
+            valid &= ~numpy.asarray(id_nulls, dtype=bool)
+        self.x = x[valid]
+        self.y = y[valid]
+        self.ids = numpy.asarray(ids)[valid]
+        self.elements = None if elements is None else numpy.asarray(elements)[valid]
+        self.element_nulls = None
+        if elements is not None and element_nulls is not None:
+            self.element_nulls = numpy.asarray(element_nulls, dtype=bool)[valid]
+
+        if cKDTree is not None:
+            self.tree = cKDTree(numpy.column_stack((self.x, self.y)))
+            return
+        self.tree = None
+
+        # sort the centroids by grid cell so the centroids of a row of cells
+        # are one slice found with searchsorted
+        self.cell_size = float(cell_size)
+        self.origin = (self.x.min(), self.y.min()) if len(self.x) else (0, 0)
+        cx = numpy.floor((self.x - self.origin[0]) / self.cell_size).astype('int64')
+        cy = numpy.floor((self.y - self.origin[1]) / self.cell_size).astype('int64')
+        self.rows = int(cy.max()) + 1 if len(cy) else 1
+        keys = cx * self.rows + cy
+        self.order = numpy.argsort(keys, kind='mergesort')
+        self.keys = keys[self.order]
+
+    def candidates(self, x, y, distance):
+        '''returns the positions of the centroids that may be within distance
+        of a location'''
+
+        if self.tree is not None:
+            return numpy.asarray(self.tree.query_ball_point((x, y), distance),
+            dtype='int64')
+
+        reach = int(numpy.ceil(distance / self.cell_size))
+        cx = int(numpy.floor((x - self.origin[0]) / self.cell_size))
+        cy = int(numpy.floor((y - self.origin[1]) / self.cell_size))
+        low = max(cy - reach, 0)
+        high = min(cy + reach, self.rows - 1)
+        if low > high:
+            return numpy.zeros(0, dtype='int64')
+        slices = []
+        for column in range(cx - reach, cx + reach + 1):
+            if column < 0:
+                continue
+            start = numpy.searchsorted(self.keys, column * self.rows + low, 'left')
+            stop = numpy.searchsorted(self.keys, column * self.rows + high, 'right')
+            if stop > start:
+                slices.append(self.order[start:stop])
+        if not slices:
+            return numpy.zeros(0, dtype='int64')
+        return numpy.concatenate(slices)
+
+    def query(self, x, y, k=nearest_count, distance=search_distance,
+    element=None, same=False):
+        '''returns up to k (source feature ID, distance) pairs of the nearest
+        centroids within distance of a location, nearest first. when element is
+        given, or same is True, only centroids of that element are returned, so
+        a location without an element matches nothing and centroids without an
+        element are never matched'''
+
+        same = same or element is not None
+        if same and self.elements is None:
+            raise ValueError("the centroid index has no {0} column".format(
+            biotics_element_field))
+        if same and element is None:
+            return []
+        found = self.candidates(x, y, distance)
+        if same:
+            match = self.elements[found] == element
+            if self.element_nulls is not None:
+                match &= ~self.element_nulls[found]
+            found = found[match]
+        if not len(found):
+            return []
+        dist = numpy.hypot(self.x[found] - x, self.y[found] - y)
+        within = dist <= distance
+        found = found[within]
+        dist = dist[within]
+        nearest = numpy.argsort(dist, kind='mergesort')[:k]
+        return [(self.ids[i].item(), float(d)) for i, d in zip(found[nearest],
+        dist[nearest])]
+
+def loadindex(folder=centroid_folder):
+    '''function that builds the spatial index from the memory-mapped columns of
+    the biotics centroid export. null values are stored as 0 in integer
+    columns, so the null masks of the export are loaded with them'''
+
+    def column(name):
+        path = os.path.join(folder, name + ".npy")
+        if not os.path.exists(path):
+            return None
+        return numpy.load(path, mmap_mode='r')
+
+    return CentroidIndex(column('x'), column('y'), column(source_id_field),
+    column(biotics_element_field), id_nulls=column(source_id_field + ".null"),
+    element_nulls=column(biotics_element_field + ".null"))
+
+################################################################################
+# Define batch annotation
+################################################################################
+
+def annotate(index, features=input_features, table=output_table,
+k=nearest_count, distance=search_distance, element=same_element):
+    '''function that writes the nearest biotics source features of every FIND
+    feature to a table with one row per FIND feature and biotics source feature.
+    lines and polygons are located by their centroid, and FIND features are
+    projected to the spatial reference of the biotics centroids'''
+
+    if element and index.elements is None:
+        raise ValueError("the centroid index has no {0} column".format(
+        biotics_element_field))
+    spatial_reference = arcpy.Describe(biotics_centroids).spatialReference
+    arcpy.CreateTable_management(os.path.dirname(table), os.path.basename(table))
+    arcpy.AddField_management(table, "feature_class", "TEXT", field_length=50)
+    arcpy.AddField_management(table, "find_oid", "LONG")
+    arcpy.AddField_management(table, "refcode", "TEXT", field_length=20)
+    arcpy.AddField_management(table, "near_rank", "SHORT")
+    arcpy.AddField_management(table, source_id_field, "LONG")
+    arcpy.AddField_management(table, "distance", "DOUBLE")
+
+    with arcpy.da.InsertCursor(table, ["feature_class", "find_oid", "refcode",
+    "near_rank", source_id_field, "distance"]) as output:
+        for feature in features:
+            name = os.path.basename(feature)
+            with arcpy.da.SearchCursor(feature, ['OID@', 'refcode', 'SHAPE@XY',
+            find_element_field], spatial_reference=spatial_reference) as cursor:
+                for oid, refcode, xy, elem_name in cursor:
+                    if xy is None or xy[0] is None:
+                        continue
+                    nearest = index.query(xy[0], xy[1], k, distance,
+                    elem_name if element else None, element)
+                    for rank, (sf_id, dist) in enumerate(nearest, 1):
+                        output.insertRow([name, oid, refcode, rank, sf_id, dist])
+
+################################################################################
+# Start Script...
+################################################################################
+
+if __name__ == '__main__':
+    annotate(loadindex())
+    print "FIND Biotics nearest table created!"
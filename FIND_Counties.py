@@ -0,0 +1,279 @@
+#-------------------------------------------------------------------------------
+# Name:        FIND Counties
+# Purpose:     Assigns Pennsylvania counties to FIND features without a spatial
+#              join. The county polygons are read once into edge arrays with
+#              their bounding boxes, and the representative points of all
+#              features are looked up together with a vectorized
+#              point-in-polygon test. Counties are kept in a SQLite cache by
+#              feature and geometry hash, so only new or moved features are
+#              looked up again. Used by the DM report script.
+# Author:      agent
+# Created:     2026-10-18
+# Updated:
+#
+# To Do List/Future ideas:
+#
+#-------------------------------------------------------------------------------
+
+# import system modules
+import arcpy, hashlib, sqlite3
+import numpy
+
+county_field = "COUNTY_NAM" # county name field of the county layer
+edge_block = 2000000 # number of point and edge pairs tested at a time
+
+# list of western counties
+West = ["ERIE", "CRAWFORD", "MERCER", "LAWRENCE", "BEAVER", "WASHINGTON",
+"GREENE", "VENANGO", "BUTLER", "ALLEGHENY", "FAYETTE", "WESTMORELAND",
+"ARMSTORNG", "INDIANA", "CLARION", "JEFFERSON", "FOREST", "WARREN",
+"MCKEAN", "ELK", "CLEARFIELD", "CAMBRIA", "SOMERSET", "BEDFORD", "BLAIR",
+"CENTRE", "CLINTON", "POTTER", "CAMERON", "HUNTINGDON", "FULTON",
+"FRANKLIN"]
+
+def location(county):
+    '''function that returns W for western counties and E for all others'''
+
+    return "W" if county in West else "E"
+
+################################################################################
+# Define county index
+################################################################################
+
+def layersource(layer):
+    '''function that returns the data source of a layer file, or the path of
+    anything else'''
+
+    if layer.lower().endswith(".lyr"):
+        return arcpy.mapping.Layer(layer).dataSource
+    return layer
+
+def polygonedges(polygon):
+    '''function that returns the start and end coordinates of every edge of a
+    polygon, interior rings included'''
+
+    edges = []
+    for part in polygon:
+        ring = []
+        # rings of a part are separated by None
+        for point in list(part) + [None]:
+            if point is not None:
+                ring.append((point.X, point.Y))
+                continue
+            if len(ring) > 2:
+                if ring[0] != ring[-1]:
+                    ring.append(ring[0])
+                ring = numpy.array(ring, dtype=float)
+                edges.append(numpy.hstack((ring[:-1], ring[1:])))
+            ring = []
+    if not edges:
+        return numpy.zeros((0, 4))
+    return numpy.vstack(edges)
+
+def representativepoint(shape):
+    '''function that returns a point of a feature that lies on the feature:
+    the point itself, the middle of a line or the label point of a polygon'''
+
+    if shape is None:
+        return None
+    if shape.type == "polyline":
+        point = shape.positionAlongLine(0.5, True).firstPoint
+    elif shape.type == "polygon":
+        point = shape.labelPoint
+    else:
+        point = shape.firstPoint
+    if point is None:
+        return None
+    return point.X, point.Y
+
+class CountyIndex(object):
+    '''county polygons held as edge arrays. points are matched to the counties
+    whose bounding box holds them and then tested against the county edges
+    with the even-odd rule'''
+
+    def __init__(self, names, edges, spatial_reference=None):
+        self.names = list(names)
+        self.edges = edges
+        self.spatial_reference = spatial_reference
+        self.boxes = numpy.array([(e[:, [0, 2]].min(), e[:, [1, 3]].min(),
+        e[:, [0, 2]].max(), e[:, [1, 3]].max()) if len(e) else (numpy.inf,
+        numpy.inf, -numpy.inf, -numpy.inf) for e in edges], dtype=float).reshape(-1, 4)
+
+    @classmethod
+    def load(cls, counties):
+        '''reads the county polygons of a county layer or feature class'''
+
+        source = layersource(counties)
+        names = []
+        edges = []
+        with arcpy.da.SearchCursor(source, [county_field, "SHAPE@"]) as cursor:
+            for name, shape in cursor:
+                if shape is None:
+                    continue
+                names.append(name)
+                edges.append(polygonedges(shape))
+        return cls(names, edges, arcpy.Describe(source).spatialReference)
+
+    def inside(self, county, x, y):
+        '''returns a mask of the points that are inside one county'''
+
+        edges = self.edges[county]
+        result = numpy.zeros(len(x), dtype=bool)
+        if not len(edges):
+            return result
+        x1, y1, x2, y2 = [edges[:, i] for i in range(4)]
+        step = max(1, edge_block // len(edges))
+        for start in range(0, len(x), step):
+            px = x[start:start + step, None]
+            py = y[start:start + step, None]
+            spans = (y1 > py) != (y2 > py)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                crossing = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            crossings = (spans & (px < crossing)).sum(axis=1)
+            result[start:start + step] = crossings % 2 == 1
+        return result
+
+    def assign(self, x, y):
+        '''returns the position of the county of each point, or -1 for points
+        outside every county. a point on a shared boundary goes to the first
+        county it is found in'''
+
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        result = numpy.full(len(x), -1, dtype='int64')
+        # points without a location fall outside every bounding box
+        valid = numpy.isfinite(x) & numpy.isfinite(y)
+        x = numpy.where(valid, x, numpy.inf)
+        y = numpy.where(valid, y, numpy.inf)
+        for county, (xmin, ymin, xmax, ymax) in enumerate(self.boxes):
+            candidates = numpy.flatnonzero((result < 0) & (x >= xmin) &
+            (x <= xmax) & (y >= ymin) & (y <= ymax))
+            if not len(candidates):
+                continue
+            found = self.inside(county, x[candidates], y[candidates])
+            result[candidates[found]] = county
+        return result
+
+    def countynames(self, x, y):
+        '''returns the county name of each point, or None outside every
+        county'''
+
+        return [self.names[i] if i >= 0 else None for i in self.assign(x, y)]
+
+################################################################################
+# Define county cache
+################################################################################
+
+def layersignature(counties):
+    '''function that returns a hash of the names and geometry of the county
+    polygons, which changes whenever the counties are edited, whatever kind of
+    data source the county layer points to'''
+
+    source = layersource(counties)
+    with arcpy.da.SearchCursor(source, [county_field, "SHAPE@WKB"]) as cursor:
+        polygons = sorted((name or u"", hashlib.md5(shape).hexdigest() if
+        shape is not None else u"") for name, shape in cursor)
+    signature = hashlib.md5(source.encode('utf-8') if isinstance(source,
+    unicode) else source)
+    for name, shape in polygons:
+        signature.update(u"{0}|{1}\n".format(name, shape).encode('utf-8'))
+    return signature.hexdigest()
+
+def opencache(path, counties):
+    '''function that opens the county cache, creating its tables the first
+    time. the cache is emptied when the county layer has changed since it was
+    written'''
+
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE IF NOT EXISTS county_layer "
+    "(signature TEXT)")
+    connection.execute("CREATE TABLE IF NOT EXISTS feature_counties "
+    "(feature_class TEXT, feature_key TEXT, shape_hash TEXT, county TEXT, "
+    "location TEXT, PRIMARY KEY (feature_class, feature_key))")
+    signature = layersignature(counties)
+    row = connection.execute("SELECT signature FROM county_layer").fetchone()
+    if row is None or row[0] != signature:
+        connection.execute("DELETE FROM feature_counties")
+        connection.execute("DELETE FROM county_layer")
+        connection.execute("INSERT INTO county_layer VALUES (?)", (signature,))
+        connection.commit()
+    return connection
+
+def readcache(connection, feature):
+    '''function that returns the cached geometry hash, county and location of
+    the features of a feature class by feature key'''
+
+    return dict((key, (shape_hash, county, region)) for key, shape_hash, county,
+    region in connection.execute("SELECT feature_key, shape_hash, county, "
+    "location FROM feature_counties WHERE feature_class = ?", (feature,)))
+
+def writecache(connection, feature, rows, removed=()):
+    '''function that stores (feature key, geometry hash, county, location)
+    rows of a feature class and forgets the features that no longer exist'''
+
+    connection.executemany("INSERT OR REPLACE INTO feature_counties VALUES "
+    "(?, ?, ?, ?, ?)", ((feature,) + tuple(row) for row in rows))
+    connection.executemany("DELETE FROM feature_counties WHERE feature_class = ? "
+    "AND feature_key = ?", ((feature, key) for key in removed))
+    connection.commit()
+
+def shapehash(shape):
+    '''function that returns a hash of the geometry of a feature'''
+
+    if shape is None:
+        return None
+    return hashlib.md5(shape.WKB).hexdigest()
+
+################################################################################
+# Define feature assignment
+################################################################################
+
+def assignfeatures(counties, features, fields, connection=None):
+    '''function that reads the fields of several feature classes, given as a
+    dictionary of feature class and field names, and returns their rows, each
+    followed by the county name and location of the feature, as a dictionary
+    of feature class and list of rows. features are identified by
+    GlobalID, or object ID when there is none. counties of features whose
+    geometry is unchanged since they were cached are taken from the cache, and
+    the representative points of all other features are looked up together'''
+
+    spatial_reference = arcpy.Describe(layersource(counties)).spatialReference
+    results = {}
+    pending = []
+    for feature in features:
+        keyfield = next((field.name for field in arcpy.ListFields(feature) if
+        field.type == 'GlobalID'), "OID@")
+        known = readcache(connection, feature) if connection else {}
+        rows = []
+        seen = set()
+        with arcpy.da.SearchCursor(feature, [keyfield, "SHAPE@"] +
+        list(fields[feature]),
+        spatial_reference=spatial_reference) as cursor:
+            for row in cursor:
+                key = unicode(row[0])
+                shape = row[1]
+                seen.add(key)
+                geometry = shapehash(shape)
+                cached = known.get(key)
+                if cached is not None and cached[0] == geometry:
+                    rows.append(list(row[2:]) + [cached[1], cached[2]])
+                    continue
+                rows.append(list(row[2:]) + [None, None])
+                pending.append((feature, len(rows) - 1, key, geometry,
+                representativepoint(shape) or (numpy.nan, numpy.nan)))
+        results[feature] = rows
+        if connection:
+            writecache(connection, feature, [], set(known) - seen)
+
+    if pending:
+        index = CountyIndex.load(counties)
+        x, y = numpy.array([item[4] for item in pending], dtype=float).T
+        updates = dict((feature, []) for feature in features)
+        for (feature, position, key, geometry, point), name in zip(pending,
+        index.countynames(x, y)):
+            region = location(name)
+            results[feature][position][-2:] = [name, region]
+            updates[feature].append((key, geometry, name, region))
+        if connection:
+            for feature, rows in updates.items():
+                writecache(connection, feature, rows)
+    return results
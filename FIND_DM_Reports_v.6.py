@@ -29,7 +29,11 @@ print "DM Reviewer - This report will return a separate report for each " \
 print "DM All - This report will return all of the aforementioned reports"
 
 # import system modules
-import arcpy, os, datetime
+import arcpy, os, datetime, time
+from FIND_ReportWriter import writerows, writefiles
+from FIND_ReportData import RecordTable, PrefixRules, SubstringMatcher, \
+pivottable
+from FIND_Counties import assignfeatures, opencache
 from arcpy import env
 from arcpy.sa import *
 
@@ -63,40 +67,95 @@ elementTables = ["element_point1", "element_line1","community_poly1",
 # path to county layer
 counties = r"W:\\LYRS\\Boundaries_Political\\County Hollow.lyr"
 
+# file format of the reports - '.xlsx', '.csv' or '.parquet'
+report_format = ".xlsx"
+
 # path to folder where DM reports will be saved as Excel files
 ReportsPath = "P:\Conservation Programs\Natural Heritage Program\Data Management" \
 "\Instructions, procedures and documentation\FIND\FIND_2016\Reports"
 
+# cache of the counties of FIND features, kept next to this script
+county_cache = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+"FIND_DM_Reports_counties.sqlite")
+
+# biologists by the initials in the reference codes of their records, used
+# for records created by generic accounts
+biologist_refcodes = [
+("hna", "ahnatkovich"), ("geo", "bgeorgic"), ("lep", "bleppo"),
+("eic", "ceichelberger"), ("tra", "ctracey"), ("dwa", "dwatts"),
+("yea", "dyeany"), ("zim", "ezimmerman"), ("eaz", "ezimmerman"),
+("alb", "jalbert"), ("kun", "jkunsman"), ("mcp", "jmcpherson"),
+("mil", "rmiller"), ("wis", "jwisgo"), ("gip", "kgipe"), ("fur", "mfuredi"),
+("wal", "mwalsh"), ("wat", "dwatts"), ("woo", "pwoods"), ("gle", "rgleason"),
+("gru", "sgrund"), ("sch", "sschuette"), ("shc", "sschuette"),
+("dav", "ezimmerman")]
+
+# shared accounts whose records are credited to a biologist
+generic_accounts = ["arcgis", "tjadmin", "administrator", "bgeorgic"]
+
+# ID reviewers by element code prefix and location (None for either location).
+# the reviewer of the longest matching prefix is assigned
+reviewer_rules = [
+("P", "E", "jkunsman"), ("P", "W", "sgrund"),
+("N", None, "sschuette"),
+("C", None, "ezimmerman"), ("H", None, "ezimmerman"), ("G", None, "ezimmerman"),
+("AB", "E", "dwatts"), ("AB", "W", "dyeany"),
+("AM", None, "ceichelberger"),
+("AR", "E", "ceichelberger"), ("AA", "E", "ceichelberger"),
+("AR", "W", "rmiller"), ("AA", "W", "rmiller"),
+("AF", "E", "Need Reviewer"), ("AF", "W", "Need Reviewer"),
+("IMBIV", None, "mwalsh"), ("IMGAS", None, "mwalsh"),
+("IILE", "E", "bleppo"), ("IILE", "W", "pwoods"),
+("IIODO", "E", "bleppo"), ("IIODO", "W", "pwoods"),
+("IILAR", None, "cbier"),
+("II", "E", "bleppo"), ("II", "W", "pwoods"),
+("I", "E", "bleppo"), ("I", "W", "pwoods")]
+
+# AddField types of the ListFields field types
+field_types = {"String": "TEXT", "Integer": "LONG", "SmallInteger": "SHORT",
+"Double": "DOUBLE", "Single": "FLOAT", "Date": "DATE", "GUID": "GUID"}
+
 def countyinfo(counties):
-    '''function that loops through each element shapefile and assigns county
-    name to features based on spatial location'''
+    '''function that copies the fields of each element feature class to a
+    table and assigns county name and location to features based on spatial
+    location'''
+
+    # fields to be kept in the element tables
+    keepFields = ["OID", "COUNTY_NAM", "refcode",
+    "created_by", "created_on", "dm_stat", "dm_stat_comm", "last_up_by",
+    "last_up_on", "element_type", "created_by", "elem_name", "id_prob",
+    "id_prob_comm", "specimen_taken", "specimen_count", "specimen_desc",
+    "curatorial_meth", "specimen_repo", "voucher_photo"]
+
+    inputFields = {}
+    for input, output in zip(input_features, elementShapefiles):
+        fields = [x for x in arcpy.ListFields(input) if x.name in keepFields
+        and x.name != "COUNTY_NAM" and x.type in field_types]
+        inputFields[input] = [x.name for x in fields]
+        arcpy.CreateTable_management(env.workspace, output)
+        for field in fields:
+            arcpy.AddField_management(output, field.name,
+            field_types[field.type], field_length = field.length,
+            field_alias = field.aliasName)
+        arcpy.AddField_management(output, "COUNTY_NAM", "TEXT",
+        field_length = 50, field_alias = "County")
+        arcpy.AddField_management(output, "Location", "TEXT", field_length = 1,
+        field_alias = "Location")
+
+    # counties of unchanged features come from the cache and the rest are
+    # looked up together
+    connection = opencache(county_cache, counties)
+    try:
+        rows = assignfeatures(counties, input_features, inputFields,
+        connection)
+    finally:
+        connection.close()
 
     for input, output in zip(input_features, elementShapefiles):
-        target_features = input
-        join_features = counties
-        element_features = os.path.join(env.workspace, output)
-
-        # create fieldmap
-        fieldmappings = arcpy.FieldMappings()
-        fieldmappings.addTable(target_features)
-        fieldmappings.addTable(counties)
-
-        # fields to be kept after spatial join
-        keepFields = ["OID", "COUNTY_NAM", "refcode",
-        "created_by", "created_on", "dm_stat", "dm_stat_comm", "last_up_by",
-        "last_up_on", "element_type", "created_by", "elem_name", "id_prob",
-        "id_prob_comm", "specimen_taken", "specimen_count", "specimen_desc",
-        "curatorial_meth", "specimen_repo", "voucher_photo"]
-
-        # remove all fields not in keep fields from field map
-        for field in fieldmappings.fields:
-            if field.name not in keepFields:
-                fieldmappings.removeFieldMap(fieldmappings.findFieldMapIndex
-                (field.name))
-
-        # run the spatial join tool
-        arcpy.SpatialJoin_analysis(target_features, join_features,
-        element_features, "#", "#", fieldmappings)
+        with arcpy.da.InsertCursor(os.path.join(env.workspace, output),
+        inputFields[input] + ["COUNTY_NAM", "Location"]) as cursor:
+            for row in rows[input]:
+                cursor.insertRow(row)
 
 def elementType():
     '''function that assigns element type to all features based on name of
@@ -122,292 +181,180 @@ def mergetables():
     merge = os.path.join(env.workspace, "elementRecords")
     arcpy.Merge_management(elementTables, merge)
 
-def CreatePivotTable(inTable, outTable):
-    '''function that calculates statistics and creates pivot table'''
+def CreatePivotTable(records):
+    '''function that counts the records of each reference code by dm status
+    in one pass and returns the pivot table. there is a count field for each
+    dm status found in the records, and total_records is counted with them'''
 
-    arcpy.Statistics_analysis(inTable, outTable, "refcode COUNT;dm_stat COUNT",
-    "refcode;dm_stat")
+    return pivottable(records, "refcode", "dm_stat", "total_records")
 
-    arcpy.PivotTable_management(outTable, 'refcode', 'dm_stat', 'FREQUENCY',
-    os.path.join(env.workspace, "pivotTable"))
+def manipulateTable(pivot, records):
+    '''function that joins survey site and element record data to pivot
+    table'''
 
-def manipulateTable(pivotTable):
-    '''function that makes format changes to pivot table'''
+    # join dm status and dm status comments data from survey site to pivot table
+    surveysites = records.take(records.select(lambda record:
+    record["element_type"] == "survey_site"))
+    pivot = pivot.join("refcode", surveysites, "refcode", ["dm_stat",
+    "dm_stat_comm"], ["survey_site_dmstat", "dm_stat_comm"])
 
-    # delete records with null or blank reference code
-    with arcpy.da.UpdateCursor(pivotTable, 'refcode') as cursor:
-        for row in cursor:
-            if row[0] == None or row[0] == "":
-                cursor.deleteRow()
+    # join original data from elementRecords table to pivot table
+    pivot = pivot.join("refcode", records, "refcode", ["COUNTY_NAM",
+    "created_by", "created_on", "last_up_by", "last_up_on", "element_type",
+    "Location"])
+    return pivot
 
-    # add field and populate with total number of records by adding all records
-    arcpy.AddField_management(pivotTable, "total_records", "DOUBLE",
-    field_length = 3, field_alias = "Total Records")
-    expression = "!dmpend! + !dmproc! + !dmready! + !dr! + !idrev!"
-    arcpy.CalculateField_management(pivotTable, "total_records", expression,
-    "PYTHON_9.3")
+def unprocessed(record):
+    '''function that returns False for records when all features and the survey
+    site are processed'''
 
-    # join dm status and dm status comments data from survey site to pivot table
-    join = os.path.join(env.workspace, "survey_site1")
-    arcpy.AlterField_management(join, "dm_stat", "survey_site_dmstat",
-    "Survey Site - DM Status")
-    arcpy.JoinField_management(pivotTable, "refcode", join, "refcode",
-    ["survey_site_dmstat", "dm_stat_comm"])
+    return not (record.get("dmproc", 0) == record["total_records"] and
+    (record["survey_site_dmstat"] == "dmproc" or
+    record["survey_site_dmstat"] is None))
 
-    # join original data from elementRecords table to pivot table
-    join = os.path.join(env.workspace, "elementRecords")
-    arcpy.JoinField_management(pivotTable, "refcode", join, "refcode",
-    ["COUNTY_NAM", "created_by", "created_on", "last_up_by", "last_up_on",
-    "element_type"])
-
-    # add new field for east or west location
-    arcpy.AddField_management(pivotTable, "Location", "TEXT", "", "", 1,
-    "Location", "", "", "")
-    # list of western counties
-    West = ["ERIE", "CRAWFORD", "MERCER", "LAWRENCE", "BEAVER", "WASHINGTON",
-    "GREENE", "VENANGO", "BUTLER", "ALLEGHENY", "FAYETTE", "WESTMORELAND",
-    "ARMSTORNG", "INDIANA", "CLARION", "JEFFERSON", "FOREST", "WARREN",
-    "MCKEAN", "ELK", "CLEARFIELD", "CAMBRIA", "SOMERSET", "BEDFORD", "BLAIR",
-    "CENTRE", "CLINTON", "POTTER", "CAMERON", "HUNTINGDON", "FULTON",
-    "FRANKLIN"]
-    # populate location field with east or west depending if they are in list
-    with arcpy.da.UpdateCursor(pivotTable, ["COUNTY_NAM", "Location"]) as cursor:
-        for row in cursor:
-                if row[0] in West:
-                    row[1] = "W"
-                    cursor.updateRow(row)
-                else:
-                    row[1] = "E"
-                    cursor.updateRow(row)
-
-def dmtotal(pivotTable):
+def dmtotal(pivot):
     '''function that creates report of all unprocessed records in FIND'''
 
-    # create copy of pivot table
-    pivotTableCOPY = arcpy.TableToTable_conversion(pivotTable, env.workspace,
-    "pivotTableCOPY")
-
-    # delete records when all features are processed
-    with arcpy.da.UpdateCursor(pivotTableCOPY, ["dmproc", "total_records",
-    "survey_site_dmstat"]) as cursor:
-        for row in cursor:
-            if row[0] == row[1] and row[2] == "dmproc":
-                cursor.deleteRow()
-            elif row[0] == row[1] and row[2] is None:
-                cursor.deleteRow()
-            else:
-                pass
-    # export table as Excel file to produce final report
-    filename = "DM Total " + time.strftime("%d%b%y")+".xls"
+    # view of records unless all features are processed
+    view = pivot.view().filter(unprocessed)
+
+    # export rows to produce final report
+    filename = "DM Total " + time.strftime("%d%b%y") + report_format
     outTable = os.path.join(ReportsPath, filename)
-    arcpy.TableToExcel_conversion(pivotTableCOPY, outTable)
+    writerows(outTable, view.fields, view)
 
-def dmready(pivotTable):
+def dmready(pivot):
     '''function that creates report of all records that are ready for DM'''
 
-    # create copy of pivot table
-    pivotTableCOPY = arcpy.TableToTable_conversion(pivotTable, env.workspace,
-    "pivotTableCOPY")
-
-    # delete all records unless all features and survey site are marked dm ready
-    with arcpy.da.UpdateCursor(pivotTableCOPY, ["dmready", "total_records",
-    "survey_site_dmstat"]) as cursor:
-        for row in cursor:
-            if row[0] == row[1] and row[2] == "dmready":
-                pass
-            else:
-                cursor.deleteRow()
-
-    # export table as Excel file to produce final report
-    filename = "DM Ready " + time.strftime("%d%b%y")+".xls"
+    # view of records when all features and survey site are marked dm ready
+    view = pivot.view().filter(lambda record: record.get("dmready", 0) ==
+    record["total_records"] and record["survey_site_dmstat"] == "dmready")
+
+    # export rows to produce final report
+    filename = "DM Ready " + time.strftime("%d%b%y") + report_format
     outTable = os.path.join(ReportsPath, filename)
-    arcpy.TableToExcel_conversion(pivotTableCOPY, outTable)
+    writerows(outTable, view.fields, view)
     print "DM Ready Report Created!"
 
-def dmpending(pivotTable):
+def dmpending(pivot):
     '''function that creates report of records with at least one feature marked
     as DM Pending'''
 
-    # create copy of pivot table
-    pivotTableCOPY = arcpy.TableToTable_conversion(pivotTable, env.workspace,
-    "pivotTableCOPY")
+    # view of records that have at least one feature marked DM Pending
+    view = pivot.view().filter(lambda record: record["survey_site_dmstat"] ==
+    "dmpend")
 
-    # delete all records that do not have at least one feature marked DM Pending
-    with arcpy.da.UpdateCursor(pivotTableCOPY, "survey_site_dmstat") as cursor:
-        for row in cursor:
-            if row[0] == "dmpend":
-                pass
-            else:
-                cursor.deleteRow()
-
-    # export table as Excel file to produce final report
-    filename = "DM Pending " + time.strftime("%d%b%y")+".xls"
+    # export rows to produce final report
+    filename = "DM Pending " + time.strftime("%d%b%y") + report_format
     outTable = os.path.join(ReportsPath, filename)
-    arcpy.TableToExcel_conversion(pivotTableCOPY, outTable)
+    writerows(outTable, view.fields, view)
     print "DM Pending Report Created!"
 
-def dmbiologist(pivotTable):
-    pivotTableCOPY = arcpy.TableToTable_conversion(pivotTable, env.workspace,
-    "pivotTableCOPY")
-    with arcpy.da.UpdateCursor(pivotTableCOPY, ["dmproc", "total_records",
-    "survey_site_dmstat"]) as cursor:
-        for row in cursor:
-            if row[0] == row[1] and (row[2] == "dmproc" or row[2] is None):
-                cursor.deleteRow()
-            else:
-                pass
-
-    refname = ["hna", "geo", "lep", "eic", "tra", "dwa", "yea", "zim", "eaz",
-    "alb", "kun", "mcp", "mil", "wis", "gip", "fur", "wal", "wat", "woo", "gle",
-    "gru", "sch", "shc", "dav"]
-    createnames = ["ahnatkovich", "bgeorgic", "bleppo", "ceichelberger",
-    "ctracey", "dwatts", "dyeany", "ezimmerman", "ezimmerman", "jalbert",
-    "jkunsman", "jmcpherson", "rmiller", "jwisgo", "kgipe", "mfuredi", "mwalsh",
-    "dwatts", "pwoods", "rgleason", "sgrund", "sschuette", "sschuette",
-    "ezimmerman"]
-    for ref, name in zip(refname, createnames):
-        with arcpy.da.UpdateCursor(pivotTableCOPY, ["refcode", "created_by"]) as cursor:
-            for row in cursor:
-                if row[0] is None or row[1] is None:
-                    pass
-                else:
-                    if (row[1].lower() == "arcgis" or row[1].lower() ==
-                    "tjadmin" or row[1].lower() == "administrator" or
-                    row[1].lower() == "bgeorgic") and ref in row[0].lower():
-                        row[1] = name
-                        cursor.updateRow(row)
+def dmbiologist(pivot):
+    '''function that creates a status report of the unprocessed records of each
+    biologist'''
+
+    # records created by generic accounts are credited to the biologist whose
+    # initials are in the reference code. the first biologist found in the
+    # order of biologist_refcodes is used, unless it is a generic account and
+    # another biologist is found after it. the unprocessed records are grouped
+    # by biologist in the same pass
+    matcher = SubstringMatcher([ref for ref, name in biologist_refcodes])
+    generic = set(generic_accounts)
+    refcodes = pivot.column("refcode")
+    createdby = pivot.column("created_by")
+    groups = {}
+    for i in pivot.view().filter(unprocessed).positions():
+        biologist = createdby[i]
+        if (refcodes[i] is not None and biologist is not None and
+        biologist.lower() in generic):
+            names = [biologist_refcodes[position][1] for position in
+            matcher.find(refcodes[i].lower())]
+            if names:
+                biologist = next((name for name in names if name.lower() not
+                in generic), names[-1])
+        groups.setdefault(biologist, []).append(i)
 
     outPath = "P:\\Conservation Programs\\Natural Heritage Program\\" \
     "Data Management\\Instructions, procedures and documentation\\FIND\\" \
     "FIND_2016\\Reports\\Biologist Status Reports"
 
-    with arcpy.da.SearchCursor(pivotTableCOPY, "created_by") as cursor:
-        biologists = sorted({row[0] for row in cursor})
+    # write the attributed biologist in place of created_by
+    fields = pivot.fields
+    position = fields.index("created_by")
+
+    def credited(view, biologist):
+        for row in view:
+            row[position] = biologist
+            yield row
 
-    for biologist in biologists:
+    # write all files at once
+    files = []
+    for biologist in sorted(groups):
         if biologist is None:
             pass
         else:
-            expression = "created_by = '{}'".format(biologist)
-            tableTEMP = arcpy.TableToTable_conversion(pivotTableCOPY,
-            "in_memory", "tableTEMP", expression)
-            filename = biologist + " - " + "FIND Status Report " + time.strftime("%d%b%Y")+".xls"
+            filename = biologist + " - " + "FIND Status Report " + time.strftime("%d%b%Y") + report_format
             outTable = os.path.join(outPath, filename)
-            arcpy.TableToExcel_conversion(tableTEMP, outTable)
+            files.append((outTable, credited(pivot.view(groups[biologist]),
+            biologist)))
+    writefiles(fields, files)
     print "DM Biologist Report Created!"
 
-def idreview(elementRecords):
-    with arcpy.da.UpdateCursor(elementRecords, ["dm_stat"]) as cursor:
-        for row in cursor:
-            if row[0] != "idrev":
-                cursor.deleteRow()
+def joinelements(records):
+    '''function that returns the element records with the element code and
+    scientific name from the ET spreadsheet joined to them'''
 
     ETtableEXCEL = "P:\\Conservation Programs\\Natural Heritage Program\\" \
     "Data Management\\Instructions, procedures and documentation\\FIND\\" \
     "FIND_2016\\DM Documentation\\Admin and Maintenance\\20160209_ET.xlsx\\" \
     "Final$"
     arcpy.TableToTable_conversion (ETtableEXCEL, "in_memory", "ETtable")
-    arcpy.JoinField_management(elementRecords, "elem_name",
-    "in_memory\\ETtable", "ELEMENT_SUBNATIONAL_ID", ["ELEMENT_CODE",
-    "SCIENTIFIC_NAME"])
-
-    arcpy.AddField_management(elementRecords, "Location", "TEXT", "", "", 1,
-    "Location", "", "", "")
-
-    West = ["ERIE", "CRAWFORD", "MERCER", "LAWRENCE", "BEAVER", "WASHINGTON",
-    "GREENE", "VENANGO", "BUTLER", "ALLEGHENY", "FAYETTE", "WESTMORELAND",
-    "ARMSTORNG", "INDIANA", "CLARION", "JEFFERSON", "FOREST", "WARREN",
-    "MCKEAN", "ELK", "CLEARFIELD", "CAMBRIA", "SOMERSET", "BEDFORD", "BLAIR",
-    "CENTRE", "CLINTON", "POTTER", "CAMERON", "HUNTINGDON", "FULTON",
-    "FRANKLIN"]
-    with arcpy.da.UpdateCursor(elementRecords, ["COUNTY_NAM", "Location"]) as cursor:
-        for row in cursor:
-                if row[0] in West:
-                    row[1] = "W"
-                    cursor.updateRow(row)
-                else:
-                    row[1] = "E"
-                    cursor.updateRow(row)
-
-    with arcpy.da.UpdateCursor(elementRecords, "ELEMENT_CODE") as cursor:
-        for row in cursor:
-            if row[0] is None:
-                cursor.deleteRow()
-
-    arcpy.AddField_management(elementRecords, "Reviewer", "TEXT", "", "", 35,
-    "ID Reviewer", "", "", "")
-
-    with arcpy.da.UpdateCursor(elementRecords, ['ELEMENT_CODE', 'Location',
-    'Reviewer']) as cursor:
-        for row in cursor:
-            if row[0].startswith('P') and row[1] == "E":
-                row[2] = "jkunsman"
-            elif row[0].startswith('P') and row[1] == "W":
-                row[2] = "sgrund"
-            elif row[0].startswith('N'):
-                row[2] = "sschuette"
-            elif (row[0].startswith('C') or row[0].startswith('H') or
-            row[0].startswith('G')):
-                row[2] = "ezimmerman"
-            elif row[0].startswith('AB') and row[1] == "E":
-                row[2] = "dwatts"
-            elif row[0].startswith('AB') and row[1] == "W":
-                row[2] = "dyeany"
-            elif (row[0].startswith('AM') or (row[0].startswith('AR') or
-            row[0].startswith('AA')) and row[1] == "E"):
-                row[2] = "ceichelberger"
-            elif ((row[0].startswith('AR') or row[0].startswith('AA')) and
-            row[1] == "W"):
-                row[2] = "rmiller"
-            elif row[0].startswith('AF') and row[1] == "E":
-                row[2] = "Need Reviewer"
-            elif row[0].startswith('AF') and row[1] == "W":
-                row[2] = "Need Reviewer"
-            elif (row[0].startswith('IMBIV') or row[0].startswith('IMGAS')):
-                row[2] = "mwalsh"
-            elif (row[0].startswith('IILE') or row[0].startswith('IIODO')) and row[1] == "E":
-                row[2] = "bleppo"
-            elif (row[0].startswith('IILE') or row[0].startswith('IIODO')) and row[1] == "W":
-                row[2] = "pwoods"
-            elif row[0].startswith('IILAR'):
-                row[2] = "cbier"
-            elif row[0].startswith('II') and row[1] == "E":
-                row[2] = "bleppo"
-            elif row[0].startswith('II') and row[1] == "W":
-                row[2] = "pwoods"
-            elif row[0].startswith('I') and row[1] == "E":
-                row[2] = "bleppo"
-            elif row[0].startswith('I') and row[1] == "W":
-                row[2] = "pwoods"
-            else:
-                pass
-            cursor.updateRow(row)
-
-    fields = arcpy.ListFields(elementRecords)
+    ETtable = RecordTable.load("in_memory\\ETtable")
+    return records.join("elem_name", ETtable, "ELEMENT_SUBNATIONAL_ID",
+    ["ELEMENT_CODE", "SCIENTIFIC_NAME"])
+
+def idreview(records):
+    '''function that creates a report for each ID reviewer of the records
+    marked for ID review'''
+
+    # records marked for ID review with an element in the ET
+    rows = list(records.view().filter(lambda record: record["dm_stat"] ==
+    "idrev" and record["ELEMENT_CODE"] is not None).positions())
+
+    # assign the reviewers of the selected records at once
+    locations = records.column("Location")
+    codes = records.column("ELEMENT_CODE")
+    reviewers = [None] * len(records)
+    assigned = PrefixRules(reviewer_rules).matchall([codes[i] for i in rows],
+    [locations[i] for i in rows])
+    for i, reviewer in zip(rows, assigned):
+        reviewers[i] = reviewer
+    records.addcolumn("Reviewer", reviewers)
+
     keepFields = ["OID", "COUNTY_NAM", "refcode", "created_by", "created_on",
     "dm_stat", "Reviewer", "dm_stat_comm", "last_up_by", "last_up_on",
     "element_type", "id_prob", "id_prob_comm", "specimen_taken",
     "specimen_count", "specimen_desc", "curatorial_meth", "specimen_repo",
     "voucher_photo", "SCIENTIFIC_NAME", "ELEMENT_CODE"]
-    dropFields = [x.name for x in fields if x.name not in keepFields]
-    arcpy.DeleteField_management(elementRecords, dropFields)
+    fields = [x for x in records.fields if x in keepFields or x == records.oid]
 
     outPath = "P:\\Conservation Programs\\Natural Heritage Program\\" \
     "Data Management\\Instructions, procedures and documentation\\FIND\\" \
     "FIND_2016\\Reports\\ID Reviewers Status Reports"
 
-    with arcpy.da.SearchCursor(elementRecords, "Reviewer") as cursor:
-        reviewers = sorted({row[0] for row in cursor})
-
-    for reviewer in reviewers:
+    # group the records by reviewer in one pass and write all files at once
+    groups = records.partition("Reviewer", rows)
+    files = []
+    for reviewer in sorted(groups):
         if reviewer is None:
             pass
         else:
-            expression = "Reviewer = '{}'".format(reviewer)
-            tableTEMP = arcpy.TableToTable_conversion(elementRecords, "in_memory", "tableTEMP", expression)
-            filename = reviewer + " - " + "ID Reviewers Status Report " + time.strftime("%d%b%Y")+".xls"
+            filename = reviewer + " - " + "ID Reviewers Status Report " + time.strftime("%d%b%Y") + report_format
             outTable = os.path.join(outPath, filename)
-            arcpy.TableToExcel_conversion(tableTEMP, outTable)
+            files.append((outTable, records.view(groups[reviewer]).project(
+            fields)))
+    writefiles(fields, files)
     print "ID Reviewers Status Report Created!"
 
 ################################################################################
@@ -422,29 +369,34 @@ elementType()
 
 mergetables()
 
+# element records are read into memory once, and the pivot table and every
+# report are built from them
+records = RecordTable.load(os.path.join(env.workspace, "elementRecords"))
+if reportType.lower() in ("dm reviewer", "dm all"):
+    records = joinelements(records)
+
 if reportType.lower() == "dm reviewer":
-    idreview(os.path.join(env.workspace, "elementRecords"))
+    idreview(records)
 else:
-    CreatePivotTable(os.path.join(env.workspace, "elementRecords"),
-    os.path.join(env.workspace, "summaryStats"))
+    pivot = CreatePivotTable(records)
 
-    manipulateTable(os.path.join(env.workspace, "pivotTable"))
+    pivot = manipulateTable(pivot, records)
 
     if reportType.lower() == "dm pending":
-        dmpending(os.path.join(env.workspace, "pivotTable"))
+        dmpending(pivot)
 
     elif reportType.lower() == "dm ready":
-        dmready(os.path.join(env.workspace, "pivotTable"))
+        dmready(pivot)
 
     elif reportType.lower() == "dm biologist":
-        dmbiologist(os.path.join(env.workspace, "pivotTable"))
+        dmbiologist(pivot)
 
     elif reportType.lower() == "dm total":
-        dmtotal(os.path.join(env.workspace, "pivotTable"))
+        dmtotal(pivot)
 
     elif reportType.lower() == "dm all":
-        idreview(os.path.join(env.workspace, "elementRecords"))
-        dmpending(os.path.join(env.workspace, "pivotTable"))
-        dmready(os.path.join(env.workspace, "pivotTable"))
-        dmbiologist(os.path.join(env.workspace, "pivotTable"))
-        dmtotal(os.path.join(env.workspace, "pivotTable"))
\ No newline at end of file
+        idreview(records)
+        dmpending(pivot)
+        dmready(pivot)
+        dmbiologist(pivot)
+        dmtotal(pivot)
@@ -8,6 +8,18 @@
 #              3. removes default time from 'start_date' and 'end_date' fields
 #              4. adds 12:00:00 PM to 'start_date' and 'end_date' fields
 #              5. changes any null values in 'dm_stat' field to 'draft'
+#              Each feature class is read once with all of the rules applied
+#              to the row in memory, and only rows whose values changed are
+#              written back to the database. Only rows edited since the
+#              previous run are read unless a full rescan is requested.
+#              Rules can optionally be pushed down to the database as one
+#              set-based UPDATE statement per feature class. Each feature
+#              class is cleaned in its own edit session, optionally in
+#              parallel worker processes. Cursor edits are saved every
+#              commit_interval rows and a failed run continues from the last
+#              saved OBJECTID of each feature class. Rules are applied to
+#              whole columns of each chunk, with dates set to noon in one
+#              vectorized step and written back as datetimes.
 # Author:      Molly Moore
 # Created:     2017-02-13
 # Updated:
@@ -17,7 +29,8 @@
 #-------------------------------------------------------------------------------
 
 # import system modules
-import arcpy, os, datetime
+import arcpy, os, sys, datetime, json, sqlite3, traceback, multiprocessing
+import numpy
 from arcpy import env
 from arcpy.sa import *
 
@@ -33,65 +46,523 @@ el_poly = r'{}\FIND3.DBO.el_poly'.format(workspace)
 survey_poly = r'{}\FIND3.DBO.survey_poly'.format(workspace)
 
 input_features = [el_pt, el_line, comm_poly, comm_pt, el_poly, survey_poly]
-edit = arcpy.da.Editor(workspace)
-edit.startEditing(True, True)
-edit.startOperation()
 
-for feature in input_features:
-    with arcpy.da.UpdateCursor(feature, ['dm_stat', 'refcode']) as cursor:
+# set to True to clean every row in every feature class (e.g. to recover from a
+# failed run) instead of only the rows edited since the previous run
+full_rescan = False
+
+# file that stores the last_up_on/OBJECTID high-water mark of each feature
+# class from the previous run. runs in 'sqlite' pushdown mode use a file next
+# to pushdown_database instead
+watermark_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+"FIND_DatabaseCleanup_watermarks.json")
+watermark_format = "%Y-%m-%d %H:%M:%S"
+
+# set to 'sqlserver' to run the cleanup rules as set-based UPDATE statements
+# against the enterprise database, or 'sqlite' to run them against the
+# GeoPackage/SQLite copy in pushdown_database. None applies every rule with the
+# cursor. rules that can't be expressed in SQL are always applied with the
+# cursor, so in 'sqlite' mode every rule needs a SQLite version
+pushdown_dialect = None
+pushdown_database = None
+# the FIND feature classes are versioned, so statements are run against the
+# versioned views in this version
+pushdown_version = "DBO.DEFAULT"
+
+# number of worker processes that clean feature classes at the same time - each
+# worker cleans one feature class in its own edit session. set to 1 to clean the
+# feature classes one after another in this process
+cleanup_workers = len(input_features)
+
+# number of rows read before the cursor edits are saved and the edit session is
+# restarted, so that locks are released for field editors. the OBJECTID of the
+# last saved row is kept in a checkpoint file so a failed run continues where it
+# stopped. set to 0 to save each feature class once at the end
+commit_interval = 5000
+checkpoint_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+"FIND_DatabaseCleanup_{0}.checkpoint.json")
+
+################################################################################
+# Define cleanup rules applied to each column
+################################################################################
+
+def normalizestatus(values):
+    '''function that returns 'dr' (draft) for null or blank dm_stat values'''
+
+    return ['dr' if value == None or value == "" or value == " " else value
+    for value in values]
+
+def normalizerefcode(values):
+    '''function that removes white space from reference codes and makes all
+    characters upper case'''
+
+    return [value if value == None else value.replace(' ', '').upper()
+    for value in values]
+
+def normalizedate(values):
+    '''function that sets the time of a column of dates to 12:00:00 PM in one
+    vectorized step. null dates and dates that are already at noon are returned
+    unchanged'''
+
+    nulls = numpy.array([value is None for value in values], dtype=bool)
+    if nulls.all():
+        return list(values)
+    dates = numpy.array(values, dtype='datetime64[us]')
+    noon = (dates.astype('datetime64[D]').astype('datetime64[us]') +
+    numpy.timedelta64(12, 'h'))
+    changed = ~nulls & (dates != noon)
+    if not changed.any():
+        return list(values)
+
+    update = list(values)
+    for i, value in zip(numpy.flatnonzero(changed),
+    noon[changed].astype(object)):
+        update[i] = value
+    return update
+
+# rules are (field, function) pairs, each function takes and returns a column of
+# values - dm_stat and refcode are cleaned in every
+# feature class, element features use date_start/date_stop and survey sites use
+# survey_start/survey_end
+status_rules = [('dm_stat', normalizestatus), ('refcode', normalizerefcode)]
+element_date_rules = [('date_start', normalizedate), ('date_stop', normalizedate)]
+survey_date_rules = [('survey_start', normalizedate), ('survey_end', normalizedate)]
+
+cleanup_rules = {el_pt: status_rules + element_date_rules,
+el_line: status_rules + element_date_rules,
+comm_poly: status_rules + element_date_rules,
+comm_pt: status_rules + element_date_rules,
+el_poly: status_rules + element_date_rules,
+survey_poly: status_rules + survey_date_rules}
+
+################################################################################
+# Define set-based (SQL) versions of the cleanup rules
+################################################################################
+
+# (SET expression, WHERE condition) of each rule by database dialect - {0} is
+# replaced with the field name. the WHERE condition only selects rows whose
+# value changes. SQL Server compares strings case insensitive and ignores
+# trailing spaces, so refcodes are checked for spaces and lower case separately
+sql_rules = {
+normalizestatus: {
+'sqlserver': ("'dr'", "{0} IS NULL OR {0} IN ('', ' ')"),
+'sqlite': ("'dr'", "{0} IS NULL OR {0} IN ('', ' ')")},
+normalizerefcode: {
+'sqlserver': ("UPPER(REPLACE({0}, ' ', ''))",
+"CHARINDEX(' ', {0}) > 0 OR {0} COLLATE Latin1_General_BIN <> UPPER({0})"),
+'sqlite': ("UPPER(REPLACE({0}, ' ', ''))", "{0} <> UPPER(REPLACE({0}, ' ', ''))")},
+normalizedate: {
+'sqlserver': ("DATEADD(hour, 12, CAST(CAST({0} AS date) AS datetime2))",
+"{0} <> DATEADD(hour, 12, CAST(CAST({0} AS date) AS datetime2))"),
+'sqlite': ("strftime('%Y-%m-%dT12:00:00.000Z', {0})",
+"{0} <> strftime('%Y-%m-%dT12:00:00.000Z', {0})")}}
+
+def sqltable(feature):
+    '''function that returns the name of the table or versioned view that
+    holds a feature class in the pushdown database'''
+
+    if pushdown_dialect == 'sqlserver':
+        return os.path.basename(feature) + "_evw"
+    return os.path.basename(feature).split('.')[-1]
+
+def compilerules(feature, rules, where=None):
+    '''function that compiles the cleanup rules of a feature class into a
+    single UPDATE ... WHERE statement that only touches rows with at least one
+    value to change. returns the statement (None when no rule can be expressed
+    in SQL) and the rules that must be applied with the cursor'''
+
+    assignments = []
+    conditions = []
+    fallback = []
+    for field, rule in rules:
+        sql = sql_rules.get(rule, {}).get(pushdown_dialect)
+        if sql is None:
+            fallback.append((field, rule))
+            continue
+        expression, condition = sql
+        condition = "(" + condition.format(field) + ")"
+        assignments.append("{0} = CASE WHEN {1} THEN {2} ELSE {0} END".format(
+        field, condition, expression.format(field)))
+        conditions.append(condition)
+
+    if not assignments:
+        return None, fallback
+    statement = "UPDATE {0} SET {1} WHERE ({2})".format(sqltable(feature),
+    ", ".join(assignments), " OR ".join(conditions))
+    if where:
+        statement += " AND ({0})".format(where)
+    return statement, fallback
+
+def executesql(statements):
+    '''function that runs UPDATE statements in the pushdown database and
+    returns the number of rows updated'''
+
+    written = 0
+    if pushdown_dialect == 'sqlite':
+        connection = sqlite3.connect(pushdown_database)
+        try:
+            for statement in statements:
+                written += connection.execute(statement).rowcount
+            connection.commit()
+        finally:
+            connection.close()
+        return written
+
+    connection = arcpy.ArcSDESQLExecute(workspace)
+    # edits to the DEFAULT version are made directly through the versioned
+    # views, any other version has to be opened for editing first
+    named_version = not pushdown_version.upper().endswith(".DEFAULT")
+    if named_version:
+        connection.execute("EXEC sde.set_current_version '{0}'".format(
+        pushdown_version))
+        connection.execute("EXEC sde.edit_version '{0}', 1".format(
+        pushdown_version))
+    try:
+        for statement in statements:
+            result = connection.execute(statement + "; SELECT @@ROWCOUNT")
+            if isinstance(result, (int, long)):
+                written += result
+    finally:
+        if named_version:
+            connection.execute("EXEC sde.edit_version '{0}', 2".format(
+            pushdown_version))
+    return written
+
+def featurewatermark(feature, where=None):
+    '''function that returns the number of rows selected by the where clause
+    and their last_up_on/OBJECTID high-water mark. used when every rule was
+    pushed down to the database and the cursor didn't read the rows. in
+    sqlite mode the rows are counted in the SQLite copy that was updated'''
+
+    if pushdown_dialect == 'sqlite':
+        return sqlitewatermark(feature, where)
+
+    scanned = 0
+    last_up_on = None
+    oid = None
+    with arcpy.da.SearchCursor(feature, ['OID@', 'last_up_on'], where) as cursor:
         for row in cursor:
-            if row[0] == None or row[0] == "" or row[0] == " ":
-                row[0] = 'dr'
-                cursor.updateRow(row)
-            if row[1] == None:
-                pass
-            else:
-                update = str(row[1]).replace(' ', '')
-                update = update.upper()
-                row[1] = update
-                cursor.updateRow(row)
-
-for feature in input_features[0:5]:
-    with arcpy.da.UpdateCursor(feature, ['date_start', 'date_stop']) as cursor:
+            scanned += 1
+            if oid is None or row[0] > oid:
+                oid = row[0]
+            if row[1] is not None and (last_up_on is None or row[1] > last_up_on):
+                last_up_on = row[1]
+
+    if last_up_on is not None:
+        last_up_on = last_up_on.strftime(watermark_format)
+    return scanned, [last_up_on, oid]
+
+def sqliteoidfield(feature):
+    '''function that returns the OBJECTID field name of a feature class in the
+    SQLite copy, which is the integer primary key of its table'''
+
+    connection = sqlite3.connect(pushdown_database)
+    try:
+        columns = connection.execute("PRAGMA table_info({0})".format(
+        sqltable(feature))).fetchall()
+    finally:
+        connection.close()
+    for cid, name, datatype, notnull, default, pk in columns:
+        if pk and datatype.upper() == 'INTEGER':
+            return name
+    return 'rowid'
+
+def sqlitewatermark(feature, where=None):
+    '''function that returns the number of rows of a feature class selected by
+    the where clause in the SQLite copy and their last_up_on/OBJECTID
+    high-water mark'''
+
+    statement = "SELECT COUNT(*), MAX(last_up_on), MAX(\"{0}\") FROM {1}".format(
+    sqliteoidfield(feature), sqltable(feature))
+    if where:
+        statement += " WHERE {0}".format(where)
+    connection = sqlite3.connect(pushdown_database)
+    try:
+        scanned, last_up_on, oid = connection.execute(statement).fetchone()
+    finally:
+        connection.close()
+
+    # SQLite dates are text such as 2017-02-13T10:15:00.000Z
+    if last_up_on is not None:
+        last_up_on = last_up_on[:19].replace('T', ' ')
+    return scanned, [last_up_on, oid]
+
+################################################################################
+# Define incremental cleanup and cursor cleanup
+################################################################################
+
+def watermarkpath():
+    '''function that returns the high-water mark file. runs against the
+    SQLite copy keep their own file next to the copy, so they never move the
+    high-water marks of the enterprise database forward'''
+
+    if pushdown_dialect == 'sqlite':
+        return os.path.splitext(pushdown_database)[0] + "_watermarks.json"
+    return watermark_file
+
+def readwatermarks():
+    '''function that returns the high-water marks saved by the previous run as
+    a dictionary of feature class name: [last_up_on, OBJECTID]'''
+
+    path = watermarkpath()
+    if full_rescan or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def writewatermarks(watermarks):
+    '''function that saves the high-water marks for the next run'''
+
+    with open(watermarkpath(), 'w') as f:
+        json.dump(watermarks, f, indent=4, sort_keys=True)
+
+def oidfield(feature):
+    '''function that returns the delimited OBJECTID field name of a feature
+    class'''
+
+    return arcpy.AddFieldDelimiters(feature, arcpy.Describe(feature).OIDFieldName)
+
+def watermarkclause(feature, watermark):
+    '''function that returns a where clause selecting rows edited or added
+    since the high-water mark. returns None when there is no high-water mark
+    so that every row is read'''
+
+    if not watermark:
+        return None
+    last_up_on, oid = watermark
+    if pushdown_dialect == 'sqlite':
+        # the clause is run against the SQLite copy, where dates are text such
+        # as 2017-02-13T10:15:00.000Z
+        date_field = '"last_up_on"'
+        oid_field = '"{0}"'.format(sqliteoidfield(feature))
+        if last_up_on is not None:
+            last_up_on = last_up_on.replace(' ', 'T')
+    else:
+        date_field = arcpy.AddFieldDelimiters(feature, "last_up_on")
+        oid_field = oidfield(feature)
+    clauses = []
+    if last_up_on is not None:
+        clauses.append("{0} > '{1}'".format(date_field, last_up_on))
+    if oid is not None:
+        clauses.append("{0} > {1}".format(oid_field, oid))
+    if not clauses:
+        return None
+    return " OR ".join(clauses)
+
+def capwatermark(last_up_on, started):
+    '''function that returns the earlier of the last_up_on high-water mark of
+    the rows read and the time the run started. rows saved by field editors
+    while the run is reading may already have been passed by the cursor, and
+    have to be newer than the saved mark to be read by the next run'''
+
+    if last_up_on is None or started is None:
+        return last_up_on
+    return min(last_up_on, started)
+
+def readcheckpoint(name, where):
+    '''function that returns the checkpoint saved by a failed run of a feature
+    class as a dictionary with the last saved OBJECTID and the high-water mark
+    of the saved rows. checkpoints saved with a different where clause (e.g.
+    before a full rescan was requested) are ignored'''
+
+    path = checkpoint_file.format(name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['where'] != where:
+        return None
+    return checkpoint
+
+def writecheckpoint(name, checkpoint):
+    '''function that saves the checkpoint of a feature class, or removes it
+    when checkpoint is None'''
+
+    path = checkpoint_file.format(name)
+    if checkpoint is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as f:
+        json.dump(checkpoint, f, indent=4, sort_keys=True)
+
+def cleanfeature(feature, rules, where=None, start=None, limit=None):
+    '''function that reads the rows of a feature class once in OBJECTID order,
+    applies every cleanup rule to the columns in memory and only updates rows
+    whose values changed. reading starts after the start OBJECTID and stops
+    after limit rows. returns the number of rows scanned, rows written, the last
+    OBJECTID read and the last_up_on high-water mark of the rows read'''
+
+    fields = [field for field, rule in rules]
+
+    if start is not None:
+        clause = "{0} > {1}".format(oidfield(feature), start)
+        where = clause if not where else "({0}) AND {1}".format(where, clause)
+    sql_clause = (None, "ORDER BY {0}".format(oidfield(feature)))
+
+    rows = []
+    with arcpy.da.SearchCursor(feature, ['OID@', 'last_up_on'] + fields, where,
+    sql_clause=sql_clause) as cursor:
         for row in cursor:
-            if row[0] == None:
-                pass
-            else:
-                value = str(row[0])
-                update = value.split(' ', 2)[0]
-                update = update + ' 12:00:00 PM'
-                row[0] = update
-                cursor.updateRow(row)
-
-            if row[1] == None:
-                pass
-            else:
-                value = str(row[1])
-                update = value.split(' ', 2)[0]
-                update = update + ' 12:00:00 PM'
-                row[1] = update
-                cursor.updateRow(row)
-
-with arcpy.da.UpdateCursor(survey_poly, ['survey_start', 'survey_end']) as cursor:
-    for row in cursor:
-        if row[0] == None:
-            pass
-        else:
-            value = str(row[0])
-            update = value.split(' ', 2)[0]
-            update = update + ' 12:00:00 PM'
-            row[0] = update
-            cursor.updateRow(row)
-
-        if row[1] == None:
-            pass
+            rows.append(row)
+            if limit and len(rows) >= limit:
+                break
+    if not rows:
+        return 0, 0, start, None
+
+    # apply each rule to its whole column and keep the rows with a change
+    columns = zip(*rows)
+    oids = columns[0]
+    updates = zip(*[rule(column) for (field, rule), column in
+    zip(rules, columns[2:])])
+    changes = {}
+    for oid, row, update in zip(oids, rows, updates):
+        if list(update) != list(row[2:]):
+            changes[oid] = list(update)
+
+    # write the changed rows back, selecting them by OBJECTID in groups
+    changed = sorted(changes)
+    for i in range(0, len(changed), 1000):
+        clause = "{0} IN ({1})".format(oidfield(feature),
+        ", ".join(str(oid) for oid in changed[i:i + 1000]))
+        with arcpy.da.UpdateCursor(feature, ['OID@'] + fields, clause) as cursor:
+            for row in cursor:
+                cursor.updateRow([row[0]] + changes[row[0]])
+
+    last_up_on = [value for value in columns[1] if value is not None]
+    last_up_on = max(last_up_on).strftime(watermark_format) if last_up_on else None
+    return len(rows), len(changes), oids[-1], last_up_on
+
+def cleanupfeature(feature, watermark=None):
+    '''function that cleans one feature class in its own edit session, saving
+    the edits every commit_interval rows. returns the feature class name, rows
+    scanned, rows written, new high-water mark and the error message if the
+    cleanup failed'''
+
+    name = os.path.basename(feature)
+    edit = None
+    scanned = 0
+    written = 0
+    # editor tracking may be in UTC, which is never earlier than the local
+    # clock here, so the local start time never skips an edit
+    started = datetime.datetime.now().strftime(watermark_format)
+    try:
+        where = watermarkclause(feature, watermark)
+        rules = cleanup_rules[feature]
+
+        # pushed down statements are committed by the database connection on
+        # their own and are not part of an arcpy edit session, so they are not
+        # rolled back if the cursor rules below fail
+        if pushdown_dialect:
+            statement, rules = compilerules(feature, rules, where)
+            if rules and pushdown_dialect == 'sqlite':
+                # the cursor would edit the enterprise database, not the copy
+                raise ValueError("rules without a SQLite version: {0}".format(
+                ", ".join(field for field, rule in rules)))
+            if statement:
+                written = executesql([statement])
+        if not rules:
+            scanned, newmark = featurewatermark(feature, where)
+            newmark[0] = capwatermark(newmark[0], started)
+
+        if rules:
+            edit = arcpy.da.Editor(workspace)
+            # a resumed run keeps the last_up_on high-water mark and start time
+            # of the run that failed - rows saved before the failure and edited
+            # again since then are newer than it and are read again by the next
+            # run
+            checkpoint = readcheckpoint(name, where)
+            resumed = checkpoint is not None
+            if not resumed:
+                checkpoint = {'where': where, 'oid': None, 'last_up_on': None,
+                'started': started}
+            while True:
+                edit.startEditing(True, True)
+                edit.startOperation()
+                chunk_scanned, chunk_written, oid, last_up_on = cleanfeature(
+                feature, rules, where, checkpoint['oid'], commit_interval)
+                edit.stopOperation()
+                edit.stopEditing(True)
+
+                scanned += chunk_scanned
+                written += chunk_written
+                if chunk_scanned == 0:
+                    break
+                checkpoint['oid'] = oid
+                if not resumed and last_up_on is not None and (
+                checkpoint['last_up_on'] is None or
+                last_up_on > checkpoint['last_up_on']):
+                    checkpoint['last_up_on'] = last_up_on
+                if not commit_interval or chunk_scanned < commit_interval:
+                    break
+                writecheckpoint(name, checkpoint)
+            writecheckpoint(name, None)
+            newmark = [capwatermark(checkpoint['last_up_on'],
+            checkpoint.get('started')), checkpoint['oid']]
+    except Exception:
+        # discard the unsaved edits of the failed feature class
+        if edit is not None and edit.isEditing:
+            edit.stopEditing(False)
+        return name, scanned, written, watermark, traceback.format_exc()
+
+    # keep the previous high-water mark when no rows were edited since then
+    if watermark:
+        newmark = [new if new is not None else old for new, old in
+        zip(newmark, watermark)]
+    return name, scanned, written, newmark, None
+
+def cleanupworker(args):
+    '''function that unpacks the arguments of cleanupfeature for the process
+    pool'''
+
+    return cleanupfeature(*args)
+
+################################################################################
+# Start Script...
+################################################################################
+
+if __name__ == '__main__':
+    # rows edited by this script get a new last_up_on and are read once more on
+    # the next run, where they are found to be clean and are not written again
+    watermarks = readwatermarks()
+    jobs = [(feature, watermarks.get(os.path.basename(feature))) for feature in
+    input_features]
+
+    if cleanup_workers > 1:
+        # ArcGIS runs scripts inside its own executable, so workers have to be
+        # started with the python interpreter
+        if not os.path.basename(sys.executable).lower().startswith('python'):
+            multiprocessing.set_executable(os.path.join(sys.exec_prefix,
+            'pythonw.exe'))
+        pool = multiprocessing.Pool(min(cleanup_workers, len(jobs)))
+        try:
+            results = pool.map(cleanupworker, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [cleanupworker(job) for job in jobs]
+
+    # only move the high-water marks forward for feature classes whose edits
+    # were saved
+    errors = []
+    for name, scanned, written, newmark, error in results:
+        if error is None:
+            watermarks[name] = newmark
         else:
-            value = str(row[1])
-            update = value.split(' ', 2)[0]
-            update = update + ' 12:00:00 PM'
-            row[1] = update
-            cursor.updateRow(row)
-
-del cursor
-edit.stopOperation()
-edit.stopEditing(True)
\ No newline at end of file
+            errors.append((name, error))
+    writewatermarks(watermarks)
+
+    # print report of rows scanned vs. rows written for each feature class
+    for name, scanned, written, newmark, error in results:
+        if error is None:
+            print "{0}: {1} rows scanned, {2} rows written".format(name,
+            scanned, written)
+    print "{0} rows scanned, {1} rows written".format(sum(r[1] for r in
+    results), sum(r[2] for r in results))
+
+    for name, error in errors:
+        print "{0}: cleanup failed".format(name)
+        print error
+    if errors:
+        sys.exit(1)
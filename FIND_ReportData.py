@@ -0,0 +1,324 @@
+#-------------------------------------------------------------------------------
+# Name:        FIND Report Data
+# Purpose:     Holds FIND tables in memory for reporting. A table is read once
+#              with a search cursor into one list of values per field, and
+#              every report is a lazy view over that shared data, so several
+#              reports can be written from one read without copying or
+#              deleting rows. Pivot tables are counted and tables
+#              are joined in one pass over the data. Also holds the prefix
+#              rules and substring matcher used to assign records to people.
+#              Used by the DM report script.
+# Author:      agent
+# Created:     2026-10-18
+# Updated:
+#
+# To Do List/Future ideas:
+#
+#-------------------------------------------------------------------------------
+
+################################################################################
+# Define in-memory table
+################################################################################
+
+class RecordTable(object):
+    '''in-memory columnar copy of a table. columns holds one list of values for
+    each field, and rows are referred to by their position in those lists'''
+
+    def __init__(self, fields, columns=None, oid=None):
+        self.fields = list(fields)
+        if columns is None:
+            columns = [[] for field in self.fields]
+        self.columns = dict(zip(self.fields, [list(column) for column in
+        columns]))
+        self.oid = oid
+
+    @classmethod
+    def load(cls, table, where=None):
+        '''reads a table into memory, skipping geometry fields the way
+        TableToExcel does'''
+
+        import arcpy
+        described = [field for field in arcpy.ListFields(table) if field.type
+        not in ('Geometry', 'Raster', 'Blob')]
+        fields = [field.name for field in described]
+        oid = next((field.name for field in described if field.type == 'OID'),
+        None)
+        with arcpy.da.SearchCursor(table, fields, where) as cursor:
+            rows = [row for row in cursor]
+        columns = zip(*rows) if rows else None
+        return cls(fields, columns, oid)
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]]) if self.fields else 0
+
+    def column(self, field):
+        '''returns the values of one field'''
+
+        return self.columns[field]
+
+    def addcolumn(self, field, values):
+        '''adds a field with one value for each row, replacing the field if it
+        already exists'''
+
+        values = list(values)
+        if len(values) != len(self):
+            raise ValueError("{0} has {1} values for {2} rows".format(field,
+            len(values), len(self)))
+        if field not in self.columns:
+            self.fields.append(field)
+        self.columns[field] = values
+
+    def positions(self, indices=None):
+        '''returns the row positions of a selection, or of every row'''
+
+        return xrange(len(self)) if indices is None else indices
+
+    def record(self, index):
+        '''returns one row as a dictionary of field names and values'''
+
+        return dict((field, self.columns[field][index]) for field in self.fields)
+
+    def select(self, predicate, indices=None):
+        '''returns the positions of the rows for which predicate returns True.
+        predicate is given each row as a dictionary. indices limits the
+        selection to the rows of an earlier selection'''
+
+        return list(self.view(indices).filter(predicate).positions())
+
+    def partition(self, field, indices=None):
+        '''returns the positions of the selected rows grouped by the value of a
+        field, or of a list holding one value for each row, in one pass'''
+
+        values = self.columns[field] if isinstance(field, basestring) else field
+        groups = {}
+        for i in self.positions(indices):
+            groups.setdefault(values[i], []).append(i)
+        return groups
+
+    def take(self, indices):
+        '''returns a new table of the selected rows'''
+
+        return RecordTable(self.fields, [[self.columns[field][i] for i in
+        indices] for field in self.fields], self.oid)
+
+    def join(self, key, other, otherkey, fields, names=None, keep="first"):
+        '''returns a new table with fields of other joined on key, replacing
+        JoinField. other is indexed once by otherkey in a dictionary and the
+        rows are matched in one pass. keep chooses the row of other that is
+        joined when its key is found more than once: "first", "last", or "all"
+        to repeat the row for each match. rows without a match get None, and
+        names renames the joined fields'''
+
+        if keep not in ("first", "last", "all"):
+            raise ValueError("keep must be first, last or all: {0}".format(keep))
+        index = {}
+        for j, value in enumerate(other.column(otherkey)):
+            if value is None:
+                continue
+            if keep == "first":
+                index.setdefault(value, j)
+            elif keep == "last":
+                index[value] = j
+            else:
+                index.setdefault(value, []).append(j)
+
+        positions = []
+        matches = []
+        for i, value in enumerate(self.column(key)):
+            found = index.get(value)
+            if keep == "all" and found is not None:
+                positions.extend([i] * len(found))
+                matches.extend(found)
+            else:
+                positions.append(i)
+                matches.append(found)
+
+        if keep == "all":
+            joined = self.take(positions)
+        else:
+            joined = RecordTable(self.fields, [self.columns[field] for field in
+            self.fields], self.oid)
+        for field, name in zip(fields, names or fields):
+            values = other.columns[field]
+            joined.addcolumn(name, [None if j is None else values[j] for j in
+            matches])
+        return joined
+
+    def rows(self, fields=None, indices=None):
+        '''yields the values of fields for each selected row, in table order'''
+
+        columns = [self.columns[field] for field in (fields or self.fields)]
+        for i in self.positions(indices):
+            yield [column[i] for column in columns]
+
+    def view(self, indices=None):
+        '''returns a lazy view of the table, or of the selected rows'''
+
+        return View(self, indices)
+
+class View(object):
+    '''lazy view of the rows of a RecordTable. filters, projections and sorts
+    are recorded as they are added and applied only when the view is iterated,
+    so views compose without making intermediate tables and only the rows
+    that are emitted are read'''
+
+    def __init__(self, table, indices=None, predicates=(), fields=None,
+    order=None):
+        self.table = table
+        self.indices = indices
+        self.predicates = tuple(predicates)
+        self.fields = list(fields or table.fields)
+        self.order = order
+
+    def derive(self, **changes):
+        '''returns a copy of the view with some of its settings changed'''
+
+        settings = dict(indices=self.indices, predicates=self.predicates,
+        fields=self.fields, order=self.order)
+        settings.update(changes)
+        return View(self.table, **settings)
+
+    def filter(self, predicate):
+        '''returns the view limited to the rows for which predicate returns
+        True. predicate is given each row as a dictionary'''
+
+        return self.derive(predicates=self.predicates + (predicate,))
+
+    def project(self, fields):
+        '''returns the view limited to fields, in the given order'''
+
+        return self.derive(fields=fields)
+
+    def sort(self, fields, reverse=False):
+        '''returns the view sorted by the values of fields'''
+
+        return self.derive(order=(list(fields), reverse))
+
+    def accepts(self, index):
+        '''returns True when a row passes every filter of the view'''
+
+        record = self.table.record(index)
+        return all(predicate(record) for predicate in self.predicates)
+
+    def positions(self):
+        '''yields the positions of the rows of the view in view order. only
+        the positions of the filtered rows are held when the view is sorted'''
+
+        table = self.table
+        selected = table.positions(self.indices)
+        if self.predicates:
+            selected = (i for i in selected if self.accepts(i))
+        if self.order is None:
+            for i in selected:
+                yield i
+            return
+        fields, reverse = self.order
+        columns = [table.columns[field] for field in fields]
+        for i in sorted(selected, key=lambda i: [column[i] for column in
+        columns], reverse=reverse):
+            yield i
+
+    def __iter__(self):
+        return self.table.rows(self.fields, self.positions())
+
+def pivottable(table, key, pivot, total=None, skip=(None, "")):
+    '''function that counts the rows of a table by key field and pivot field
+    values in one pass. returns a RecordTable with one row for each key value,
+    sorted, and one count field for each pivot value found in the data, sorted.
+    when total is given a field of that name holds the count of each row. key
+    values in skip and null pivot values are not counted'''
+
+    counts = {}
+    for value, column in zip(table.column(key), table.column(pivot)):
+        if value in skip:
+            continue
+        row = counts.setdefault(value, {})
+        if column is not None:
+            row[column] = row.get(column, 0) + 1
+    columns = sorted({column for row in counts.values() for column in row})
+
+    fields = [key] + columns + ([total] if total else [])
+    rows = []
+    for value in sorted(counts):
+        row = [value] + [counts[value].get(column, 0) for column in columns]
+        if total:
+            row.append(sum(row[1:]))
+        rows.append(row)
+    return RecordTable(fields, zip(*rows) if rows else None)
+
+################################################################################
+# Define prefix rules
+################################################################################
+
+class PrefixRules(object):
+    '''rules matched by the longest prefix of a code. each rule is a prefix, a
+    qualifier such as a location (None matches any qualifier) and a value. the
+    prefixes are held in a trie of dictionaries, so a code is matched in one
+    walk over its characters however many rules there are'''
+
+    def __init__(self, rules=()):
+        self.root = {}
+        for prefix, qualifier, value in rules:
+            self.add(prefix, qualifier, value)
+
+    def add(self, prefix, qualifier, value):
+        '''adds a rule. the values of a node are kept under the key None'''
+
+        node = self.root
+        for character in prefix:
+            node = node.setdefault(character, {})
+        node.setdefault(None, {})[qualifier] = value
+
+    def match(self, code, qualifier=None):
+        '''returns the value of the longest prefix of code with a rule for the
+        qualifier or for any qualifier, or None when no rule matches'''
+
+        if code is None:
+            return None
+        found = None
+        node = self.root
+        for character in [None] + list(code):
+            if character is not None:
+                node = node.get(character)
+                if node is None:
+                    break
+            values = node.get(None)
+            if values:
+                if qualifier in values:
+                    found = values[qualifier]
+                elif None in values:
+                    found = values[None]
+        return found
+
+    def matchall(self, codes, qualifiers=None):
+        '''returns the matched value of each code of a column, with the
+        qualifier of each code from a second column'''
+
+        if qualifiers is None:
+            qualifiers = [None] * len(codes)
+        return [self.match(code, qualifier) for code, qualifier in zip(codes,
+        qualifiers)]
+
+class SubstringMatcher(object):
+    '''finds which of a list of patterns occur in a text. the patterns are kept
+    in a dictionary and every substring of the text with the length of a
+    pattern is looked up once, so the cost of a text does not grow with the
+    number of patterns'''
+
+    def __init__(self, patterns):
+        self.patterns = {}
+        for position, pattern in enumerate(patterns):
+            self.patterns.setdefault(pattern, []).append(position)
+        self.lengths = sorted({len(pattern) for pattern in self.patterns})
+
+    def find(self, text):
+        '''returns the positions in the pattern list of the patterns found in
+        text, in pattern list order'''
+
+        found = set()
+        for length in self.lengths:
+            for start in xrange(len(text) - length + 1):
+                positions = self.patterns.get(text[start:start + length])
+                if positions:
+                    found.update(positions)
+        return sorted(found)
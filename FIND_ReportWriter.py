@@ -0,0 +1,301 @@
+#-------------------------------------------------------------------------------
+# Name:        FIND Report Writer
+# Purpose:     Writes FIND report rows to .xlsx, .csv or .parquet files. Rows
+#              are streamed from any generator or cursor straight to the file,
+#              so reports are not limited to the 65,536 rows of .xls, memory
+#              use stays flat and no arcpy license is needed to write them.
+#              Sets of report files are written locally in parallel and then
+#              published to the network share. Used by the DM and ER report
+#              scripts.
+# Author:      agent
+# Created:     2026-10-18
+# Updated:
+#
+# To Do List/Future ideas:
+#
+#-------------------------------------------------------------------------------
+
+# import system modules
+import os, io, csv, datetime, re, shutil, tempfile, zipfile
+from multiprocessing.pool import ThreadPool
+from xml.sax.saxutils import escape
+try:
+    import pyarrow, pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# characters that are not allowed in xlsx cell text
+illegal_characters = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# first date of the Excel date serial numbers
+excel_epoch = datetime.datetime(1899, 12, 30)
+
+# number of report files written at the same time by writefiles
+write_threads = 8
+
+################################################################################
+# Define xlsx writer
+################################################################################
+
+xlsx_content_types = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>'''
+
+xlsx_rels = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+xlsx_workbook = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{0}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+xlsx_workbook_rels = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+# cell style 1 formats date serial numbers as dates
+xlsx_styles = u'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+def columnletters(index):
+    '''function that returns the Excel column letters of a zero based column
+    index'''
+
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+class XlsxWriter(object):
+    '''write-only .xlsx writer. rows are streamed to a temporary sheet file as
+    they are written and packaged into the workbook when the writer is
+    closed'''
+
+    def __init__(self, path, fields, sheet="Sheet1"):
+        self.path = path
+        self.sheet = sheet
+        self.rows = 0
+        handle, self.sheet_path = tempfile.mkstemp(suffix=".xml")
+        os.close(handle)
+        self.stream = io.open(self.sheet_path, 'w', encoding='utf-8')
+        self.stream.write(u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        u'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        u'<sheetData>')
+        self.write(fields)
+
+    def cell(self, reference, value):
+        '''returns the xml of one cell'''
+
+        # numpy values (e.g. numpy.int32 on Windows) are written as python
+        # values, without importing numpy here
+        if hasattr(value, 'item'):
+            value = value.item()
+        if value is None or (isinstance(value, float) and (value != value or
+        value in (float('inf'), float('-inf')))):
+            return u''
+        if isinstance(value, bool):
+            return u'<c r="{0}" t="b"><v>{1}</v></c>'.format(reference, int(value))
+        if isinstance(value, (int, long)):
+            return u'<c r="{0}"><v>{1}</v></c>'.format(reference, str(value))
+        if isinstance(value, float):
+            return u'<c r="{0}"><v>{1}</v></c>'.format(reference, repr(value))
+        if isinstance(value, datetime.datetime):
+            serial = (value - excel_epoch).total_seconds() / 86400.0
+            return u'<c r="{0}" s="1"><v>{1}</v></c>'.format(reference, repr(serial))
+        if isinstance(value, datetime.date):
+            serial = (value - excel_epoch.date()).days
+            return u'<c r="{0}" s="1"><v>{1}</v></c>'.format(reference, serial)
+        if not isinstance(value, unicode):
+            value = str(value).decode('utf-8', 'replace')
+        text = escape(illegal_characters.sub(u'', value))
+        return u'<c r="{0}" t="inlineStr"><is><t xml:space="preserve">{1}</t></is></c>'.format(
+        reference, text)
+
+    def write(self, row):
+        '''writes one row to the sheet'''
+
+        self.rows += 1
+        self.stream.write(u'<row r="{0}">'.format(self.rows) + u''.join(
+        self.cell(columnletters(i) + str(self.rows), value) for i, value in
+        enumerate(row)) + u'</row>')
+
+    def close(self):
+        '''finishes the sheet and writes the workbook'''
+
+        self.stream.write(u'</sheetData></worksheet>')
+        self.stream.close()
+        try:
+            with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED) as workbook:
+                workbook.writestr('[Content_Types].xml', xlsx_content_types.encode('utf-8'))
+                workbook.writestr('_rels/.rels', xlsx_rels.encode('utf-8'))
+                workbook.writestr('xl/workbook.xml', xlsx_workbook.format(
+                escape(self.sheet[:31], {'"': '&quot;'})).encode('utf-8'))
+                workbook.writestr('xl/_rels/workbook.xml.rels',
+                xlsx_workbook_rels.encode('utf-8'))
+                workbook.writestr('xl/styles.xml', xlsx_styles.encode('utf-8'))
+                workbook.write(self.sheet_path, 'xl/worksheets/sheet1.xml')
+        finally:
+            os.remove(self.sheet_path)
+
+################################################################################
+# Define csv and parquet writers
+################################################################################
+
+class CsvWriter(object):
+    '''.csv writer that writes each row as it is received'''
+
+    def __init__(self, path, fields):
+        self.stream = open(path, 'wb')
+        self.writer = csv.writer(self.stream)
+        self.write(fields)
+
+    def write(self, row):
+        '''writes one row'''
+
+        self.writer.writerow([value.encode('utf-8') if isinstance(value,
+        unicode) else value for value in row])
+
+    def close(self):
+        '''closes the file'''
+
+        self.stream.close()
+
+class ParquetWriter(object):
+    '''.parquet writer that writes a row group every batch_size rows. column
+    types are taken from the first row group. needs pyarrow'''
+
+    def __init__(self, path, fields, batch_size=50000):
+        if pyarrow is None:
+            raise ImportError("pyarrow is needed to write .parquet reports")
+        self.path = path
+        self.fields = [unicode(field) for field in fields]
+        self.batch_size = batch_size
+        self.batch = []
+        self.writer = None
+        self.schema = None
+
+    def write(self, row):
+        '''adds one row to the current row group'''
+
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''writes the current row group'''
+
+        columns = zip(*self.batch) if self.batch else [[] for field in self.fields]
+        if self.writer is None:
+            arrays = [pyarrow.array(list(column)) for column in columns]
+            # columns without values in the first row group are written as text
+            arrays = [array.cast(pyarrow.string()) if array.type ==
+            pyarrow.null() else array for array in arrays]
+            table = pyarrow.Table.from_arrays(arrays, names=self.fields)
+            self.schema = table.schema
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        else:
+            table = pyarrow.Table.from_arrays([pyarrow.array(list(column),
+            type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema)
+        self.writer.write_table(table)
+        self.batch = []
+
+    def close(self):
+        '''writes the last row group and closes the file'''
+
+        if self.batch or self.writer is None:
+            self.flush()
+        self.writer.close()
+
+# report writers by file extension
+report_writers = {'.xlsx': XlsxWriter, '.csv': CsvWriter,
+'.parquet': ParquetWriter}
+
+################################################################################
+# Define report functions
+################################################################################
+
+def writerows(path, fields, rows):
+    '''function that streams rows from any iterable (a generator, cursor or
+    list) into a report file. the format is chosen by the file extension. the
+    file is written next to its destination and moved into place when it is
+    complete. returns the number of rows written'''
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in report_writers:
+        raise ValueError("unsupported report format: {0}".format(extension))
+
+    staging = path + ".tmp"
+    writer = report_writers[extension](staging, fields)
+    count = 0
+    try:
+        for row in rows:
+            writer.write(row)
+            count += 1
+        writer.close()
+    except Exception:
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+    if os.path.exists(path):
+        os.remove(path)
+    shutil.move(staging, path)
+    return count
+
+def publish(staging, path):
+    '''function that moves a finished local file to its destination. the file
+    is copied next to the destination under a temporary name and renamed, so
+    a partly copied report is never seen under its real name'''
+
+    partial = path + ".tmp"
+    shutil.copyfile(staging, partial)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(partial, path)
+    os.remove(staging)
+
+def writefiles(fields, files, threads=write_threads):
+    '''function that writes several report files with the same fields at the
+    same time. files is a list of (path, rows) pairs. each file is written to
+    a local folder first and then published to its destination. returns the
+    number of rows written to each file'''
+
+    files = list(files)
+    if not files:
+        return []
+    folder = tempfile.mkdtemp()
+
+    def write(item):
+        number, (path, rows) = item
+        # files are numbered so reports with the same name can't collide
+        staging = os.path.join(folder, "{0}_{1}".format(number,
+        os.path.basename(path)))
+        count = writerows(staging, fields, rows)
+        publish(staging, path)
+        return count
+
+    pool = ThreadPool(min(threads, len(files)))
+    try:
+        return pool.map(write, enumerate(files))
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(folder, ignore_errors=True)